@@ -1,30 +1,125 @@
 import tensorflow as tf
 
 
+class ResetStateWrapper(tf.nn.rnn_cell.RNNCell):
+    """Cell wrapper which resets the state of the wrapped cell to zero at
+    the time steps whose last input feature is 1, and passes the other
+    features on to the wrapped cell. Used with packed sequences (see
+    ASSISTDataProvider.pack), where a new student starts at those steps.
+
+    Like the wrappers of tf.nn.rnn_cell it does not add a variable scope, so
+    the variables have the same names as those of the wrapped cell."""
+
+    def __init__(self, cell):
+        super(ResetStateWrapper, self).__init__()
+        self._cell = cell
+
+    @property
+    def state_size(self):
+        return self._cell.state_size
+
+    @property
+    def output_size(self):
+        return self._cell.output_size
+
+    def zero_state(self, batch_size, dtype):
+        return self._cell.zero_state(batch_size, dtype)
+
+    def __call__(self, inputs, state, scope=None):
+        keep = 1. - inputs[:, -1:]
+        state = tf.contrib.framework.nest.map_structure(lambda s: s * keep, state)
+        return self._cell(inputs[:, :-1], state, scope=scope)
+
+
 class LstmModel:
 
     def __repr__(self):
         return "LstmModel"
 
     def __init__(self, max_time_steps=973, feature_len=293,
-                 n_distinct_questions=146, var_dropout=True, batch_size=32):
-        """Initialise task-specific parameters."""
+                 n_distinct_questions=146, var_dropout=True, batch_size=32,
+                 input_dtype=tf.float32, reset_channel=False):
+        """Initialise task-specific parameters.
+
+        input_dtype is the dtype the inputs are fed with (e.g. int8 for
+        one-hot inputs). They are cast to float32 inside the graph.
+        If reset_channel is True, the last of the feature_len input features
+        marks the steps at which the recurrent state is reset, as in packed
+        sequences (see ASSISTDataProvider.pack).
+        max_time_steps may be None to feed batches of any length."""
         self.max_time_steps = max_time_steps
         self.feature_len = feature_len
         self.n_distinct_questions = n_distinct_questions
         self.var_dropout = var_dropout
         self.acc_init = None
         self.auc_init = None
+        self.loss_init = None
         self.summary_loss = None
         self.summary_aucacc = None
+        self.summary_norms = None
         self.batch_size = batch_size
+        self.input_dtype = tf.as_dtype(input_dtype)
+        self.reset_channel = reset_channel
         self.reuse = False
+        self.sync_optimizer = None
+        self.accumulate = None
+        self.accum_answers = None
+        self.accum_buffers = []
+        self.accum_init = None
+        self.lengths = None
+
+    def build_graph(self, n_hidden_units=200, clip_norm=5*1e-5, optimisation='adam',
+                    num_replicas=1, metrics_device=None, accum_steps=1):
+        """Build the model, training and metrics ops.
+
+        Parameters
+        ----------
+        num_replicas : int (default=1)
+            number of workers training synchronously. If > 1, the gradients
+            of all workers are averaged before each update
+        accum_steps : int (default=1)
+            if > 1, gradients are accumulated over micro-batches: running
+            `accumulate` adds the gradients of a batch, and running
+            `training` applies their mean over the `accum_answers` answers
+            of the accumulated batches (see _build_training)
+        metrics_device : str (default=None)
+            if not None, place the (local) metric variables on this device,
+            e.g. a worker device when the model variables are placed on
+            parameter servers
+        """
+        self._build_model(n_hidden_units=n_hidden_units)
+        self._build_training(clip_norm=clip_norm, optimisation=optimisation,
+                             num_replicas=num_replicas, accum_steps=accum_steps)
+        if metrics_device is None:
+            self._build_metrics()
+        else:
+            with tf.device(metrics_device):
+                self._build_metrics()
+
+    def build_inference_graph(self, n_hidden_units=200):
+        """Build only the model (no optimizer, gradients or metrics), e.g. to
+        compute predictions from a training checkpoint."""
+        self._build_model(n_hidden_units=n_hidden_units)
 
-    def build_graph(self, n_hidden_units=200, clip_norm=5*1e-5, optimisation='adam'):
+    def build_evaluation_graph(self, n_hidden_units=200):
+        """Build the model and metrics ops, without the training ops, e.g. to
+        evaluate checkpoints in a separate process."""
         self._build_model(n_hidden_units=n_hidden_units)
-        self._build_training(clip_norm=clip_norm, optimisation=optimisation)
         self._build_metrics()
 
+    def build_mastery_graph(self, n_hidden_units=200):
+        """Build the model with sequence lengths and the mastery ops, e.g. to
+        query the knowledge state of students from a training checkpoint.
+
+        The RNN runs up to the length (fed to `lengths`) of each student.
+        `mastery` is the predicted probability of answering each problem set
+        correctly after the last step of each student, of shape
+        (batch, n_distinct_questions), or only of the problem sets whose
+        (0 based) columns are fed to `mastery_columns`."""
+        self.lengths = tf.placeholder(tf.int32, shape=[None], name='lengths')
+        self._build_model(n_hidden_units=n_hidden_units)
+        self._build_mastery()
+
     def _build_model(self, n_hidden_units=200):
         """Build a TensorFlow computational graph for an LSTM network.
 
@@ -45,6 +140,21 @@ class LstmModel:
             RNN parameters from training phase
         """
 
+        # the batch dimension is dynamic, so the final (smaller) batch of an
+        # epoch can be fed to the same graph
+        self.inputs = tf.placeholder(self.input_dtype,
+                                     shape=[None,
+                                            self.max_time_steps,
+                                            self.feature_len],
+                                     name='inputs')
+        rnn_inputs = tf.cast(self.inputs, tf.float32)
+        self.targets = tf.placeholder(tf.float32, shape=[None], name='targets')
+        self.target_ids = tf.placeholder(tf.int32, shape=[None], name='target_ids')
+        # weight of the loss of each answer, e.g. the importance weights of
+        # sampled students (see sampler.py). The metrics are not weighted
+        self.example_weights = tf.placeholder_with_default(
+            tf.ones_like(self.targets), shape=[None], name='example_weights')
+
         self.keep_prob = tf.placeholder_with_default(1.0, shape=(),
                                                      name='keep_prob')
 
@@ -64,10 +174,15 @@ class LstmModel:
                 cell = tf.nn.rnn_cell.DropoutWrapper(cell,
                                                      output_keep_prob=self.keep_prob,
                                                      dtype=tf.float32)
+            if self.reset_channel:
+                cell = ResetStateWrapper(cell)
 
+            # lengths is None (all steps are run) unless built for mastery
             self.outputs, self.state = tf.nn.dynamic_rnn(cell=cell,
-                                                         inputs=self.inputs,
+                                                         inputs=rnn_inputs,
+                                                         sequence_length=self.lengths,
                                                          dtype=tf.float32)
+            self.sequence_outputs = self.outputs
             sigmoid_w = tf.get_variable(dtype=tf.float32,
                                         name="sigmoid_w",
                                         shape=[n_hidden_units,
@@ -75,6 +190,7 @@ class LstmModel:
             sigmoid_b = tf.get_variable(dtype=tf.float32,
                                         name="sigmoid_b",
                                         shape=[self.n_distinct_questions])
+            self.sigmoid_w, self.sigmoid_b = sigmoid_w, sigmoid_b
 
             # make first dim batch_size times max_time_steps
             self.outputs = tf.reshape(self.outputs,
@@ -84,16 +200,41 @@ class LstmModel:
             logits = tf.reshape(logits, [-1])
             self.logits = tf.dynamic_partition(logits, self.target_ids, 2)[1]
 
-            loss_per_example = tf.nn.sigmoid_cross_entropy_with_logits(
+            self.loss_per_example = tf.nn.sigmoid_cross_entropy_with_logits(
                 logits=self.logits, labels=self.targets)
-            self.loss = tf.reduce_mean(loss_per_example)
+            self.loss = tf.reduce_mean(self.loss_per_example * self.example_weights)
             self.summary_loss = [tf.summary.scalar('loss', self.loss)]
 
             # need predictions to calculate accuracy and auc
             self.predictions = tf.nn.sigmoid(self.logits)
 
-    def _build_training(self, clip_norm=5*1e-5, optimisation='adam'):
-        """Define parameters updates."""
+    def _build_mastery(self):
+        """Compute the predictions of all (or the selected) problem sets
+        from the output at the last step of each student only."""
+        with tf.name_scope('mastery'):
+            # outputs after the length of a student are zero, so students
+            # without any steps get sigmoid(sigmoid_b)
+            last_steps = tf.stack([tf.range(tf.shape(self.lengths)[0]),
+                                   tf.maximum(self.lengths - 1, 0)], axis=1)
+            last_outputs = tf.gather_nd(self.sequence_outputs, last_steps)
+            self.mastery_columns = tf.placeholder_with_default(
+                tf.range(self.n_distinct_questions), shape=[None], name='mastery_columns')
+            sigmoid_w = tf.gather(self.sigmoid_w, self.mastery_columns, axis=1)
+            sigmoid_b = tf.gather(self.sigmoid_b, self.mastery_columns)
+            self.mastery = tf.nn.sigmoid(tf.matmul(last_outputs, sigmoid_w) + sigmoid_b)
+
+    def _build_training(self, clip_norm=5*1e-5, optimisation='adam', num_replicas=1,
+                        accum_steps=1):
+        """Define parameters updates.
+
+        With accum_steps > 1 the gradients of each batch, multiplied by its
+        number of answers, are added to buffers by `accumulate`. `training`
+        divides the sums by the number of answers of the accumulated batches
+        (fed to `accum_answers`), so every answer counts the same as in one
+        large batch, also when the last batches of an epoch are smaller. It
+        then clips and applies them, increments global_step once and zeroes
+        the buffers. The buffers are local variables, so they are not saved
+        in checkpoints; run `accum_init` to initialise them."""
 
         # track number of batches seen
         self.global_step = tf.Variable(0, name="global_step", trainable=False)
@@ -114,7 +255,18 @@ class LstmModel:
             elif optimisation == 'sgd':
                 optimizer = tf.train.GradientDescentOptimizer(learning_rate=self.learning_rate)
 
+            if num_replicas > 1:
+                optimizer = tf.train.SyncReplicasOptimizer(
+                    optimizer,
+                    replicas_to_aggregate=num_replicas,
+                    total_num_replicas=num_replicas)
+                self.sync_optimizer = optimizer
+
             grads, trainable_vars = list(zip(*optimizer.compute_gradients(self.loss)))
+            self._build_norms(grads, trainable_vars)
+
+            if accum_steps > 1:
+                grads = self._build_accumulation(grads, trainable_vars)
 
             if clip_norm:
                 # grads, _ = tf.clip_by_global_norm(grads, clip_norm)
@@ -125,8 +277,60 @@ class LstmModel:
                 self.grads_and_vars,
                 global_step=self.global_step)
 
+            if accum_steps > 1:
+                with tf.control_dependencies([self.training]):
+                    self.training = tf.group(
+                        *[buffer.assign(tf.zeros_like(buffer))
+                          for buffer in self.accum_buffers],
+                        name='reset_accumulators')
+
+    def _build_accumulation(self, grads, trainable_vars):
+        """Define the gradient buffers and the op adding grads to them.
+        Returns the mean gradients over the answers of the accumulated
+        batches."""
+        self.accum_answers = tf.placeholder_with_default(1.0, shape=(), name='accum_answers')
+        with tf.name_scope('accumulation'):
+            # local, so that checkpoints of runs with and without
+            # accumulation can be restored into each other
+            self.accum_buffers = [
+                tf.Variable(tf.zeros(var.get_shape(), dtype=var.dtype.base_dtype),
+                            trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                            name=var.op.name.replace('/', '_') + '_accum')
+                for var in trainable_vars]
+            self.accum_init = tf.variables_initializer(self.accum_buffers)
+            # the loss is a mean over the answers of the batch
+            num_answers = tf.cast(tf.size(self.targets), tf.float32)
+            self.accumulate = tf.group(
+                *[buffer.assign_add(tf.convert_to_tensor(grad) * num_answers)
+                  for buffer, grad in zip(self.accum_buffers, grads)],
+                name='accumulate')
+            return [buffer / self.accum_answers for buffer in self.accum_buffers]
+
+    def _build_norms(self, grads, trainable_vars):
+        """Define the (unclipped) gradient and weight norms used to monitor
+        training. They are only computed when fetched, so they can be fetched
+        together with the training op without an extra forward/backward pass."""
+        with tf.name_scope('norms'):
+            self.global_grad_norm = tf.global_norm(grads)
+            self.grad_norms = [tf.norm(grad) for grad in grads]
+            self.weight_norms = [tf.norm(var) for var in trainable_vars]
+
+        self.summary_norms = [tf.summary.scalar('global_grad_norm', self.global_grad_norm)]
+        for grad, var, grad_norm, weight_norm in zip(
+                grads, trainable_vars, self.grad_norms, self.weight_norms):
+            self.summary_norms.extend([
+                tf.summary.scalar('grad_norm/' + var.op.name, grad_norm),
+                tf.summary.scalar('weight_norm/' + var.op.name, weight_norm),
+                tf.summary.histogram('grad/' + var.op.name, grad),
+                tf.summary.histogram('weight/' + var.op.name, var)])
+
     def _build_metrics(self):
-        """Compute accuracy and AUC."""
+        """Compute accuracy, AUC and the mean loss over all answers.
+
+        The metrics are streaming, so batches of different sizes are weighted
+        by their number of answers."""
+        self.mean_loss = tf.metrics.mean(self.loss_per_example, name="mean_loss")
+
         self.accuracy = tf.metrics.accuracy(labels=self.targets,
                                             predictions=tf.round(self.predictions),
                                             name="acc")
@@ -138,11 +342,15 @@ class LstmModel:
         self.summary_aucacc = [
             tf.summary.scalar(
                 'auc', self.auc[0]), tf.summary.scalar(
-                'accuracy', self.accuracy[0])]
+                'accuracy', self.accuracy[0]), tf.summary.scalar(
+                'mean_loss', self.mean_loss[0])]
 
         auc_var = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope="auc")
         self.auc_init = tf.variables_initializer(var_list=auc_var)
 
         acc_var = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope="acc")
         self.acc_init = tf.variables_initializer(var_list=acc_var)
+
+        loss_var = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope="mean_loss")
+        self.loss_init = tf.variables_initializer(var_list=loss_var)
        
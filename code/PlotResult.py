@@ -1,12 +1,12 @@
-import tensorflow as tf
 import numpy as np
-import matplotlib
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import pickle
 
 
 def PlotResult(event_file, epochs, save_dir, train_result, valid_result):
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+
     '''
     train_result = []
     valid_result = []
@@ -0,0 +1,96 @@
+"""K-fold cross-validation of run_training.py.
+
+Every fold is trained in its own run_training.py process. The folds run
+concurrently, each pinned to its own cpus, and read a single memory-mapped
+copy of the data.
+"""
+
+from data_provider import ASSISTDataProvider, save_provider_data
+from process_utils import (available_cpus, cpu_slots, cpus_option,
+                           script_command, thread_capped_env, thread_options)
+
+import json
+import os
+import subprocess
+import numpy as np
+
+# options of the parent run which are not passed on to the fold runs
+PARENT_ONLY_OPTIONS = ['name', 'model_dir', 'split_dir', 'shared_data_dir',
+                       'cv_folds', 'fold', 'num_threads', 'intra_op_threads',
+                       'inter_op_threads', 'cpus']
+
+
+def run_cross_validation(args, save_dir):
+    """Train all args.cv_folds folds concurrently and save the mean and
+    standard deviation of their validation AUCs to save_dir/cv_results.json.
+
+    Each fold process gets args.num_threads threads, or an equal share of
+    the available cpus if args.num_threads is 0."""
+    data_provider = ASSISTDataProvider(
+        args.data_dir,
+        which_set=args.which_set,
+        which_year=args.which_year,
+        batch_size=args.batch,
+        use_plus_minus_feats=args.plus_minus_feats,
+        use_compressed_sensing=args.compressed_sensing,
+        projection=args.projection,
+        projection_dim=args.projection_dim,
+        projection_seed=args.projection_seed,
+        fraction=args.fraction)
+    shared_data_dir = os.path.join(save_dir, 'data')
+    save_provider_data(shared_data_dir, data_provider.get_data())
+    del data_provider
+
+    num_threads = args.num_threads or max(1, len(available_cpus()) // args.cv_folds)
+    slots = cpu_slots(args.cv_folds, num_threads)
+
+    processes = []
+    for fold in range(args.cv_folds):
+        options = {key: value for key, value in vars(args).items()
+                   if key not in PARENT_ONLY_OPTIONS}
+        options.update({
+            'name': 'fold_{}'.format(fold),
+            'model_dir': save_dir,
+            'shared_data_dir': shared_data_dir,
+            'cv_folds': args.cv_folds,
+            'fold': fold,
+            'cpus': cpus_option(slots[fold])})
+        options.update(thread_options(num_threads))
+        log = open(os.path.join(save_dir, 'fold_{}.log'.format(fold)), 'w')
+        process = subprocess.Popen(script_command('run_training.py', options),
+                                   stdout=log, stderr=subprocess.STDOUT,
+                                   env=thread_capped_env(num_threads))
+        processes.append((process, log))
+    print('Training {} folds in parallel, {} threads each'.format(
+        args.cv_folds, num_threads))
+
+    fold_results = []
+    for fold, (process, log) in enumerate(processes):
+        return_code = process.wait()
+        log.close()
+        results_file = os.path.join(save_dir, 'fold_{}'.format(fold), 'results.json')
+        if return_code != 0 or not os.path.isfile(results_file):
+            print('Fold {} failed, see fold_{}.log'.format(fold, fold))
+            continue
+        with open(results_file) as f:
+            fold_results.append(json.load(f))
+
+    best_aucs = [result['best_valid_auc'] for result in fold_results]
+    last_aucs = [result['last_valid_auc'] for result in fold_results]
+    cv_results = {
+        'num_folds': args.cv_folds,
+        'num_completed_folds': len(fold_results),
+        'folds': fold_results,
+        'mean_best_valid_auc': float(np.mean(best_aucs)) if best_aucs else None,
+        'std_best_valid_auc': float(np.std(best_aucs)) if best_aucs else None,
+        'mean_last_valid_auc': float(np.mean(last_aucs)) if last_aucs else None,
+        'std_last_valid_auc': float(np.std(last_aucs)) if last_aucs else None}
+    with open(os.path.join(save_dir, 'cv_results.json'), 'w') as f:
+        json.dump(cv_results, f, indent=2, sort_keys=True)
+
+    if best_aucs:
+        print('{}-fold CV AUC: {:.3f} +/- {:.3f} (best), {:.3f} +/- {:.3f} (last)'.format(
+            len(best_aucs), cv_results['mean_best_valid_auc'],
+            cv_results['std_best_valid_auc'], cv_results['mean_last_valid_auc'],
+            cv_results['std_last_valid_auc']))
+    return cv_results
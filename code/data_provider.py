@@ -9,7 +9,6 @@ import numpy as np
 import os
 import scipy.sparse as sp
 
-from sklearn.model_selection import KFold
 DEFAULT_SEED = 22012018
 
 
@@ -76,10 +75,9 @@ class DataProvider(object):
 
     def _update_num_batches(self):
         """Updates number of batches to iterate over."""
-        # maximum possible number of batches is equal to number of whole times
-        # batch_size divides in to the number of data points which can be
-        # found using integer division
-        possible_num_batches = self.inputs.shape[0] // self.batch_size
+        # the final batch holds the remaining data points if batch_size does
+        # not divide the number of data points, so that no data is dropped
+        possible_num_batches = -(-self.inputs.shape[0] // self.batch_size)
         if self.max_num_batches == -1:
             self.num_batches = possible_num_batches
         else:
@@ -106,18 +104,17 @@ class DataProvider(object):
 
     def reset(self):
         """Resets the provider to the initial state."""
-        inv_perm = np.argsort(self._current_order)
-        self._current_order = self._current_order[inv_perm]
-        self.inputs = self.inputs[inv_perm]
-        self.targets = self.targets[inv_perm]
+        self._current_order = np.arange(self.inputs.shape[0])
         self.new_epoch()
 
     def shuffle(self):
-        """Randomly shuffles order of data."""
+        """Randomly shuffles order of data.
+
+        Only the order the rows are visited in is shuffled, the data is left
+        as it is (it may be memory-mapped and shared between processes), and
+        the rows of each batch are gathered in `next`."""
         perm = self.rng.permutation(self.inputs.shape[0])
         self._current_order = self._current_order[perm]
-        self.inputs = self.inputs[perm]
-        self.targets = self.targets[perm]
 
     def next(self):
         """Returns next data batch or raises `StopIteration` if at end."""
@@ -129,8 +126,9 @@ class DataProvider(object):
         # create an index slice corresponding to current batch number
         batch_slice = slice(self._curr_batch * self.batch_size,
                             (self._curr_batch + 1) * self.batch_size)
-        inputs_batch = self.inputs[batch_slice]
-        targets_batch = self.targets[batch_slice]
+        batch_rows = self._current_order[batch_slice]
+        inputs_batch = self.inputs[batch_rows]
+        targets_batch = self.targets[batch_rows]
         self._curr_batch += 1
         return inputs_batch, targets_batch
 
@@ -146,6 +144,9 @@ class ASSISTDataProvider(DataProvider):
             fraction=1,
             use_plus_minus_feats=False,
             use_compressed_sensing=False,
+            projection='sparse',
+            projection_dim=100,
+            projection_seed=DEFAULT_SEED,
             batch_size=100,
             max_num_batches=-1,
             shuffle_order=True,
@@ -162,6 +163,14 @@ class ASSISTDataProvider(DataProvider):
                 of the final dimension of inputs. This new encoding
                 uses a +/-1 hot vector of size max_prob_set_id + 1, instead
                 of a 1 hot vector of size 2*max_prob_set_id + 1.
+            use_compressed_sensing (boolean): if True, randomly project the
+                encoding of each answer down to projection_dim dimensions.
+            projection: kind of random projection, one of
+                projection.PROJECTIONS.
+            projection_dim (int): dimension of the projected encoding.
+            projection_seed (int): seed the projection is generated from.
+                At test time, pass the projection, projection_dim and
+                projection_seed of the training run (saved in its args.json).
             batch_size (int): Number of data points to include in each batch.
             max_num_batches (int): Maximum number of batches to iterate over
                 in an epoch. If `max_num_batches * batch_size > num_data` then
@@ -172,6 +181,9 @@ class ASSISTDataProvider(DataProvider):
             rng (RandomState): A seeded random number generator.
             data: (inputs, target): if not None, use this data instead of
                 loading from file
+
+        Instead of shuffling, the students of each epoch can be drawn by a
+        sampler (see attach_sampler).
         """
         expanded_data_dir = os.path.expanduser(data_dir)
         data_path = os.path.join(
@@ -184,6 +196,11 @@ class ASSISTDataProvider(DataProvider):
         self.fraction = fraction
         self.use_plus_minus_feats = use_plus_minus_feats
         self.use_compressed_sensing = use_compressed_sensing
+        self.projection = projection
+        self.projection_dim = projection_dim
+        self.projection_seed = projection_seed
+        self.sampler = None
+        self.epoch_size = None
 
         if data:
             inputs, targets, self.target_ids = data['inputs'], \
@@ -195,52 +212,27 @@ class ASSISTDataProvider(DataProvider):
             inputs, targets = self.load_data(data_path, use_plus_minus_feats)
             inputs, targets = self.reduce_data(inputs, targets, fraction)
             if use_compressed_sensing:
-                inputs = self.apply_compressed_sensing(inputs, rng)
+                inputs = self.apply_compressed_sensing(inputs)
         # pass the loaded data to the parent class __init__
         super(ASSISTDataProvider, self).__init__(
             inputs, targets, batch_size, max_num_batches, shuffle_order, rng)
 
-    def apply_compressed_sensing(self, inputs, rng):
-        """Map input features (of length 'encoding_dim') down to a randomly generated
-        vector sampled from a standard gaussian in a lower dimensional space. If this
-        is test time, load training matrix from file. If train time, make the matrix.
+    def apply_compressed_sensing(self, inputs):
+        """Map input features (of length 'encoding_dim') down to projection_dim
+        dimensions with a seeded sparse random projection (see projection.py).
+        The matrix is regenerated from the projection, projection_dim and
+        projection_seed of this provider, so the same values give the same
+        matrix at train and test time.
         """
-        print('using compressed sensing!')
-        train_path = os.path.join(
-            self.data_dir, 'assist{0}-{1}'.format(self.which_year, 'train'))
+        from projection import project_inputs, projection_matrix
 
-        if self.which_set == 'test':
-            loaded = np.load(train_path + '-compression-matrix.npz')
-            self.compress_matrix = loaded['compress_matrix']
-            self.compress_dim = self.compress_matrix.shape[1]
-        elif self.which_set == 'train':
-            self.compress_matrix = self.make_compression_matrix(train_path, rng)
-
-        inputs = self.compress_inputs(inputs)
+        print('using compressed sensing!')
+        matrix = projection_matrix(self.projection, self.encoding_dim,
+                                   self.projection_dim, self.projection_seed)
+        inputs = project_inputs(inputs, self.encoding_dim, matrix)
+        self.encoding_dim = self.projection_dim
         return inputs
 
-    def make_compression_matrix(self, train_path, rng):
-        """Create matrix for mapping input features (of length 'encoding_dim') to
-        lower dimensional gaussian vector
-        """
-        self.compress_dim = 100  # value used in original DKT paper
-        if rng:
-            compress_matrix = rng.randn(self.encoding_dim, self.compress_dim)
-        else:
-            compress_matrix = np.random.randn(self.encoding_dim, self.compress_dim)
-
-        np.savez(train_path + '-compression-matrix', compress_matrix=compress_matrix)
-        return compress_matrix
-
-    def compress_inputs(self, inputs):
-        """Apply compression matrix to inputs"""
-        num_students = inputs.shape[0]
-        inputs = inputs.toarray()
-        inputs = np.dot(inputs.reshape(-1, self.encoding_dim), self.compress_matrix)
-        self.encoding_dim = self.compress_dim
-
-        return sp.csr_matrix(inputs.reshape(num_students, -1))
-
     def reduce_data(self, inputs, targets, fraction):
         num_data = int(inputs.shape[0] * fraction)
         inputs = inputs[:num_data]
@@ -249,11 +241,17 @@ class ASSISTDataProvider(DataProvider):
         return inputs, targets
 
     def load_data(self, data_path, use_plus_minus_feats):
-        """ Load data from files, optionally reducing and/or compressing"""
-        loaded = np.load(data_path + '-targets.npz')
+        """ Load data from files, optionally reducing and/or compressing
+
+        The one-hot/+-1 inputs, target ids and targets are held as int8
+        (files written by older versions of the preprocessing are
+        converted)."""
+        # targets is an object array of per-student lists
+        loaded = np.load(data_path + '-targets.npz', allow_pickle=True)
         self.max_num_ans = int(loaded['max_num_ans'])
         self.max_prob_set_id = int(loaded['max_prob_set_id'])
-        targets = loaded['targets']
+        targets = ragged_array([np.asarray(student, dtype=np.int8)
+                                for student in loaded['targets']])
         if use_plus_minus_feats:
             print("using plus minus feats!!!")
             inputs = sp.load_npz(data_path + '-inputs-plus-minus.npz')
@@ -261,10 +259,48 @@ class ASSISTDataProvider(DataProvider):
         else:
             inputs = sp.load_npz(data_path + '-inputs.npz')
             self.encoding_dim = 2 * self.max_prob_set_id + 1
-        self.target_ids = sp.load_npz(data_path + '-targetids.npz')
+        inputs = sp.csr_matrix(inputs, dtype=np.int8)
+        self.target_ids = sp.csr_matrix(sp.load_npz(data_path + '-targetids.npz'),
+                                        dtype=np.int8)
 
         return inputs, targets
 
+    def attach_sampler(self, sampler, epoch_size=None):
+        """Draw the students of every epoch with sampler (e.g. a
+        sampler.LossSampler over the students of this provider) instead of
+        shuffling them. Each epoch then has epoch_size students (by default
+        the number of students), and after every batch `batch_indices`,
+        `batch_weights` and `batch_lengths` hold the index, importance weight
+        and number of answers of each of its students, to update the sampler
+        and weight the loss with."""
+        assert sampler.num_students == self.inputs.shape[0], (
+            'Expected a sampler over {} students. Got {}'.format(
+                self.inputs.shape[0], sampler.num_students)
+        )
+        self.sampler = sampler
+        self.epoch_size = epoch_size or self.inputs.shape[0]
+        self._update_num_batches()
+        self.new_epoch()
+
+    def _update_num_batches(self):
+        """Updates number of batches to iterate over."""
+        super(ASSISTDataProvider, self)._update_num_batches()
+        if self.sampler is not None:
+            possible_num_batches = -(-self.epoch_size // self.batch_size)
+            if self.max_num_batches == -1:
+                self.num_batches = possible_num_batches
+            else:
+                self.num_batches = min(self.max_num_batches, possible_num_batches)
+
+    def new_epoch(self):
+        """Starts a new epoch, drawing its students if a sampler is attached
+        (the order of the data is left as it is) or possibly shuffling."""
+        if self.sampler is None:
+            super(ASSISTDataProvider, self).new_epoch()
+            return
+        self._curr_batch = 0
+        self._epoch_indices, self._epoch_weights = self.sampler.sample(self.epoch_size)
+
     def next(self):
         """Returns next data batch or raises `StopIteration` if at end."""
         if self._curr_batch + 1 > self.num_batches:
@@ -275,10 +311,17 @@ class ASSISTDataProvider(DataProvider):
         # create an index slice corresponding to current batch number
         batch_slice = slice(self._curr_batch * self.batch_size,
                             (self._curr_batch + 1) * self.batch_size)
-        inputs_batch = self.inputs[batch_slice]
-        targets_batch = self.targets[batch_slice]
-        # target_ids_global = self.target_ids[batch_slice]
-        target_ids_batch = self.target_ids[batch_slice]
+        if self.sampler is not None:
+            # the students drawn for this epoch, in the order they were drawn
+            self.batch_weights = self._epoch_weights[batch_slice]
+            batch_rows = self.batch_indices = self._epoch_indices[batch_slice]
+        else:
+            batch_rows = self._current_order[batch_slice]
+        inputs_batch = self.inputs[batch_rows]
+        targets_batch = self.targets[batch_rows]
+        target_ids_batch = self.target_ids[batch_rows]
+        if self.sampler is not None:
+            self.batch_lengths = np.array([len(student) for student in targets_batch])
         self._curr_batch += 1
 
         batch_inputs, batch_target_ids, batch_targets = \
@@ -290,41 +333,27 @@ class ASSISTDataProvider(DataProvider):
         """reshape batch of data ready to be processed by an RNN"""
         # extract one-hot encoded feature vectors and reshape them
         # so we can feed them to the RNN
+        # the inputs keep their compact dtype (int8, or float32 if compressed)
+        # and are cast to float32 in the graph
         batch_inputs = inputs_batch.toarray()
+        # the final batch of an epoch may hold fewer than batch_size students
         batch_inputs = batch_inputs.reshape(
-            self.batch_size, self.max_num_ans, self.encoding_dim)
-        # targets_batch is a list of lists, which we need to flatten
-        batch_targets = [i for sublist in targets_batch for i in sublist]
-        batch_targets = np.array(batch_targets, dtype=np.float32)
+            inputs_batch.shape[0], self.max_num_ans, self.encoding_dim)
+        # targets_batch is an array of per-student arrays, which we need to flatten
+        batch_targets = np.concatenate(targets_batch).astype(np.float32)
         # during learning, the data for each student in a batch gets shuffled together
         # hence, we need a vector of indices to locate their predictions after learning
         batch_target_ids = target_ids_batch.toarray()
-        batch_target_ids = np.array(
-            batch_target_ids.reshape(-1),
-            dtype=np.int32)
+        batch_target_ids = batch_target_ids.reshape(-1).astype(np.int32)
 
         return batch_inputs, batch_target_ids, batch_targets
 
-    def reset(self):
-        """Resets the provider to the initial state."""
-        inv_perm = np.argsort(self._current_order)
-        self._current_order = self._current_order[inv_perm]
-        self.inputs = self.inputs[inv_perm]
-        self.targets = self.targets[inv_perm]
-        self.target_ids = self.target_ids[inv_perm]
-        self.new_epoch()
-
-    def shuffle(self):
-        """Randomly shuffles order of data."""
-        perm = self.rng.permutation(self.inputs.shape[0])
-        self._current_order = self._current_order[perm]
-        self.inputs = self.inputs[perm]
-        self.targets = self.targets[perm]
-        self.target_ids = self.target_ids[perm]
-
-    def _get_k_folds(self, k, threshold=None):
+    def _get_k_folds(self, k, threshold=None, folds=None):
         """ Returns k pairs of DataProviders: (train_data_provider, val_data_provider)
-        where the data split in each tuple is determined by k-fold cross val."""
+        where the data split in each tuple is determined by k-fold cross val.
+        If folds is given, only the pairs of those fold indices are returned."""
+
+        from sklearn.model_selection import KFold
 
         assert self.which_set == 'train', (
             'Expected which_set to be train. '
@@ -336,7 +365,12 @@ class ASSISTDataProvider(DataProvider):
 
         kf = KFold(n_splits=k)
         # init list of DPs
-        for train_index, val_index in kf.split(inputs):
+        # the folds are taken in the (shuffled) order the rows are visited in
+        order = self._current_order
+        for fold, (train_index, val_index) in enumerate(kf.split(order)):
+            if folds is not None and fold not in folds:
+                continue
+            train_index, val_index = order[train_index], order[val_index]
             inputs_train, inputs_val = inputs[train_index], inputs[val_index]
             targets_train, targets_val = targets[train_index], targets[val_index]
             target_ids_train, targets_ids_val = target_ids[train_index], target_ids[val_index]
@@ -377,6 +411,9 @@ class ASSISTDataProvider(DataProvider):
                 fraction=self.fraction,
                 use_plus_minus_feats=self.use_plus_minus_feats,
                 use_compressed_sensing=self.use_compressed_sensing,
+                projection=self.projection,
+                projection_dim=self.projection_dim,
+                projection_seed=self.projection_seed,
                 batch_size=self.batch_size,
                 max_num_batches=self.max_num_batches,
                 shuffle_order=self.shuffle_order,
@@ -389,6 +426,9 @@ class ASSISTDataProvider(DataProvider):
                 fraction=self.fraction,
                 use_plus_minus_feats=self.use_plus_minus_feats,
                 use_compressed_sensing=self.use_compressed_sensing,
+                projection=self.projection,
+                projection_dim=self.projection_dim,
+                projection_seed=self.projection_seed,
                 batch_size=self.batch_size,
                 max_num_batches=self.max_num_batches,
                 shuffle_order=self.shuffle_order,
@@ -396,19 +436,142 @@ class ASSISTDataProvider(DataProvider):
                 data=val_data)
             yield (train_dp, val_dp)
 
-    def train_validation_split(self, threshold=None):
+    def train_validation_split(self, threshold=None, num_folds=5, fold=0):
         """Return 2 data providers with 80/20 data split
 
+        By default the first of 5 folds is used. Other folds can be selected
+        for cross-validation with num_folds and fold.
+
         Note, we break up a student's sequence (into threshold-sized chunks)
         *after* the train/val split since if we did it beforehand then the same
         students' data might be split across the two sets, which would make the
         validation set a bad proxy for the test set"""
-        for train, validation in self._get_k_folds(5, threshold):
+        assert 0 <= fold < num_folds, (
+            'Expected fold to be in [0, {}). Got {}'.format(num_folds, fold)
+        )
+        for train, validation in self._get_k_folds(num_folds, threshold, folds=[fold]):
             train_provider = train
             validation_provider = validation
             break
         return train_provider, validation_provider
 
+    def get_data(self):
+        """Return the data of this provider as a dictionary that can be passed
+        back to the constructor (see the `data` argument) or saved to disk with
+        `save_provider_data`."""
+        return {
+            'inputs': self.inputs,
+            'targets': self.targets,
+            'target_ids': self.target_ids,
+            'max_num_ans': self.max_num_ans,
+            'max_prob_set_id': self.max_prob_set_id,
+            'encoding_dim': self.encoding_dim}
+
+    def shard(self, num_shards, index):
+        """Return a data provider over the index'th of num_shards disjoint,
+        equally sized parts of the students.
+
+        All shards have the same number of students (the remainder is
+        dropped), so workers training on different shards run the same
+        number of batches per epoch."""
+        assert 0 <= index < num_shards, (
+            'Expected index to be in [0, {}). Got {}'.format(num_shards, index)
+        )
+        shard_size = self.inputs.shape[0] // num_shards
+        shard_rows = self._current_order[index * shard_size:(index + 1) * shard_size]
+        data = self.get_data()
+        data['inputs'] = self.inputs[shard_rows]
+        data['targets'] = self.targets[shard_rows]
+        data['target_ids'] = self.target_ids[shard_rows]
+        return ASSISTDataProvider(
+            data_dir=self.data_dir,
+            which_set=self.which_set,
+            which_year=self.which_year,
+            fraction=self.fraction,
+            use_plus_minus_feats=self.use_plus_minus_feats,
+            use_compressed_sensing=self.use_compressed_sensing,
+            projection=self.projection,
+            projection_dim=self.projection_dim,
+            projection_seed=self.projection_seed,
+            batch_size=self.batch_size,
+            max_num_batches=self.max_num_batches,
+            shuffle_order=self.shuffle_order,
+            rng=self.rng,
+            data=data)
+
+    def pack(self, pack_length=None):
+        """Return a data provider whose rows each hold the answers of several
+        students, one after the other, up to pack_length (by default
+        max_num_ans) answers per row.
+
+        Students are assigned to rows by best-fit decreasing bin packing, so
+        far fewer padding steps are fed to the RNN than with one student per
+        row. A feature is appended to the encoding of every answer (so
+        encoding_dim grows by one) which is 1 at the first answer of each
+        student, telling the model where to reset its recurrent state (see
+        LstmModel's reset_channel). target_ids and targets follow the answers
+        in the same order, so predictions stay aligned with their targets."""
+        pack_length = pack_length or self.max_num_ans
+        lengths = np.array([len(student) for student in self.targets], dtype=np.int64)
+        assert lengths.max() <= pack_length, (
+            'Expected pack_length to be at least the longest sequence ({}). '
+            'Got {}'.format(lengths.max(), pack_length)
+        )
+        rows, offsets = _pack_rows(lengths, pack_length)
+        num_rows = rows.max() + 1 if len(rows) else 0
+
+        # move the answers of each student to its row, after its offset
+        encoding_dim = self.encoding_dim + 1
+        inputs = sp.coo_matrix(self.inputs)
+        steps, features = np.divmod(inputs.col, self.encoding_dim)
+        input_cols = (steps + offsets[inputs.row]) * encoding_dim + features
+        reset_cols = offsets * encoding_dim + self.encoding_dim
+        inputs = sp.csr_matrix(
+            (np.concatenate([inputs.data, np.ones(len(rows), dtype=inputs.dtype)]),
+             (np.concatenate([rows[inputs.row], rows]),
+              np.concatenate([input_cols, reset_cols]))),
+            shape=(num_rows, pack_length * encoding_dim))
+
+        target_ids = sp.coo_matrix(self.target_ids)
+        steps, problems = np.divmod(target_ids.col, self.max_prob_set_id)
+        target_ids = sp.csr_matrix(
+            (target_ids.data,
+             (rows[target_ids.row],
+              (steps + offsets[target_ids.row]) * self.max_prob_set_id + problems)),
+            shape=(num_rows, pack_length * self.max_prob_set_id))
+
+        # the targets of a row are those of its students in order of offset
+        order = np.lexsort((offsets, rows))
+        flat_targets = np.concatenate(self.targets[order]) if len(order) else np.zeros(0)
+        row_ends = np.cumsum(np.bincount(rows, weights=lengths, minlength=num_rows)
+                             .astype(np.int64))
+        targets = ragged_array(np.split(flat_targets, row_ends[:-1]))
+
+        print('Packed {} students into {} rows, {:.0%} of the steps are answers.'.format(
+            len(lengths), num_rows, lengths.sum() / max(num_rows * pack_length, 1)))
+        data = {
+            'inputs': inputs,
+            'targets': targets,
+            'target_ids': target_ids,
+            'max_num_ans': pack_length,
+            'max_prob_set_id': self.max_prob_set_id,
+            'encoding_dim': encoding_dim}
+        return ASSISTDataProvider(
+            data_dir=self.data_dir,
+            which_set=self.which_set,
+            which_year=self.which_year,
+            fraction=self.fraction,
+            use_plus_minus_feats=self.use_plus_minus_feats,
+            use_compressed_sensing=self.use_compressed_sensing,
+            projection=self.projection,
+            projection_dim=self.projection_dim,
+            projection_seed=self.projection_seed,
+            batch_size=self.batch_size,
+            max_num_batches=self.max_num_batches,
+            shuffle_order=self.shuffle_order,
+            rng=self.rng,
+            data=data)
+
     def truncate_sequences(self, inputs, target_ids, targets, threshold):
         """Split the data of each student into threshold*encoding_dim chunks.
 
@@ -434,7 +597,7 @@ class ASSISTDataProvider(DataProvider):
         for student in targets:
             for i in range(0, len(student), threshold):
                 new_targets.append(student[i:i + threshold])
-        return np.array(new_targets)
+        return ragged_array(new_targets)
 
     def _truncate_inputs_or_ids(self, input_or_id, final_dim, threshold):
 
@@ -482,3 +645,109 @@ class ASSISTDataProvider(DataProvider):
         assert os.path.isfile(data_path + '-targets.npz'), (
                 'Data file does not exist at expected path: ' + data_path
         )
+
+
+def _pack_rows(lengths, pack_length):
+    """Assign sequences of the given lengths to rows of pack_length steps
+    with best-fit decreasing bin packing. Returns the row of every sequence
+    and its offset (first step) within the row."""
+    rows = np.zeros(len(lengths), dtype=np.int64)
+    offsets = np.zeros(len(lengths), dtype=np.int64)
+    # open_rows[r] holds the rows with exactly r free steps
+    open_rows = [[] for _ in range(pack_length + 1)]
+    row_used = []
+    for i in np.argsort(-lengths, kind='mergesort'):
+        length = lengths[i]
+        free = max(length, 1)
+        while free <= pack_length and not open_rows[free]:
+            free += 1
+        if free > pack_length:
+            row = len(row_used)
+            row_used.append(0)
+        else:
+            row = open_rows[free].pop()
+        rows[i] = row
+        offsets[i] = row_used[row]
+        row_used[row] += length
+        if row_used[row] < pack_length:
+            open_rows[pack_length - row_used[row]].append(row)
+    return rows, offsets
+
+
+def ragged_array(sequences):
+    """Return a 1d object array holding one sequence per element, even if
+    all the sequences happen to have the same length."""
+    result = np.empty(len(sequences), dtype=object)
+    for i, sequence in enumerate(sequences):
+        result[i] = sequence
+    return result
+
+
+def _save_csr(path, matrix):
+    matrix = sp.csr_matrix(matrix)
+    np.save(path + '-data.npy', matrix.data)
+    np.save(path + '-indices.npy', matrix.indices)
+    np.save(path + '-indptr.npy', matrix.indptr)
+    return matrix.shape
+
+
+def _load_csr(path, shape, mmap_mode):
+    data = np.load(path + '-data.npy', mmap_mode=mmap_mode)
+    indices = np.load(path + '-indices.npy', mmap_mode=mmap_mode)
+    indptr = np.load(path + '-indptr.npy', mmap_mode=mmap_mode)
+    return sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def save_provider_data(save_dir, data):
+    """Save a provider data dictionary (see `ASSISTDataProvider.get_data`)
+    to save_dir as uncompressed .npy files.
+
+    The sparse matrices are stored as their raw CSR arrays and the ragged
+    targets as one flat array plus offsets, so that several processes can
+    memory-map the same files with `load_provider_data` instead of each
+    loading and splitting the csv-derived data themselves."""
+    if not os.path.isdir(save_dir):
+        os.makedirs(save_dir)
+    inputs_shape = _save_csr(os.path.join(save_dir, 'inputs'), data['inputs'])
+    target_ids_shape = _save_csr(os.path.join(save_dir, 'target_ids'),
+                                 data['target_ids'])
+    lengths = np.array([len(student) for student in data['targets']],
+                       dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if lengths.sum() > 0:
+        flat_targets = np.concatenate(
+            [np.asarray(student) for student in data['targets']])
+    else:
+        flat_targets = np.zeros(0)
+    np.save(os.path.join(save_dir, 'targets.npy'), flat_targets)
+    np.save(os.path.join(save_dir, 'target_offsets.npy'), offsets)
+    np.savez(os.path.join(save_dir, 'meta.npz'),
+             inputs_shape=inputs_shape,
+             target_ids_shape=target_ids_shape,
+             max_num_ans=data['max_num_ans'],
+             max_prob_set_id=data['max_prob_set_id'],
+             encoding_dim=data['encoding_dim'])
+
+
+def load_provider_data(save_dir, mmap_mode='r'):
+    """Load a provider data dictionary written by `save_provider_data`.
+
+    With the default mmap_mode the arrays are memory-mapped read-only, so
+    the pages are shared between all processes reading the same files."""
+    meta = np.load(os.path.join(save_dir, 'meta.npz'))
+    inputs = _load_csr(os.path.join(save_dir, 'inputs'),
+                       tuple(meta['inputs_shape']), mmap_mode)
+    target_ids = _load_csr(os.path.join(save_dir, 'target_ids'),
+                           tuple(meta['target_ids_shape']), mmap_mode)
+    flat_targets = np.load(os.path.join(save_dir, 'targets.npy'),
+                           mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(save_dir, 'target_offsets.npy'))
+    targets = ragged_array([flat_targets[offsets[i]:offsets[i + 1]]
+                            for i in range(len(offsets) - 1)])
+    return {
+        'inputs': inputs,
+        'targets': targets,
+        'target_ids': target_ids,
+        'max_num_ans': int(meta['max_num_ans']),
+        'max_prob_set_id': int(meta['max_prob_set_id']),
+        'encoding_dim': int(meta['encoding_dim'])}
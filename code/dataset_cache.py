@@ -0,0 +1,199 @@
+"""On-disk cache of train/validation splits.
+
+Loading, reducing, compressing, splitting and truncating the data can take
+minutes. The resulting split is saved with save_provider_data under a key
+computed from the content of the source data files and the parameters which
+determine the split, so later runs with the same data and parameters
+memory-map it instead. The cache is bounded in size; the least recently used
+entries are removed first, except for pinned entries (e.g. the splits of the
+trials of a running sweep). Pins are files next to the entries, named after
+the entry and the pinning process, so they hold for every process sharing
+the cache directory, on the same machine, until they are unpinned or the
+process that pinned them exits.
+"""
+
+from data_provider import DEFAULT_SEED, save_provider_data
+
+import hashlib
+import json
+import os
+import shutil
+
+# increase when the way splits are computed or stored changes, so that old
+# entries are no longer used
+CACHE_VERSION = 2
+HASHES_FILENAME = 'file_hashes.json'
+PIN_SUFFIX = '.pin-'
+
+
+def data_files(data_dir, which_set, which_year, use_plus_minus_feats):
+    """Return the source data files ASSISTDataProvider reads."""
+    data_path = os.path.join(os.path.expanduser(data_dir),
+                             'assist{0}-{1}'.format(which_year, which_set))
+    inputs_suffix = '-inputs-plus-minus.npz' if use_plus_minus_feats else '-inputs.npz'
+    return [data_path + suffix for suffix in [inputs_suffix, '-targetids.npz', '-targets.npz']]
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DatasetCache(object):
+    """Size-bounded cache of data splits in cache_dir.
+
+    Each entry is a directory named by its key, containing 'train' and
+    'valid' directories written by save_provider_data. Entries passed to
+    pin are not evicted by any DatasetCache of cache_dir until they are
+    unpinned or this process exits."""
+
+    def __init__(self, cache_dir, max_bytes=20 * 2**30):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.pinned = set()
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def file_hash(self, path):
+        """Return the sha256 of the content of path.
+
+        Hashes are remembered by (path, size, modification time), so
+        unchanged files are only read once."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        hashes_path = os.path.join(self.cache_dir, HASHES_FILENAME)
+        hashes = {}
+        if os.path.isfile(hashes_path):
+            with open(hashes_path) as f:
+                hashes = json.load(f)
+        known = hashes.get(path)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                digest.update(chunk)
+        hashes[path] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                        'sha256': digest.hexdigest()}
+        tmp_path = '{}.{}'.format(hashes_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(hashes, f)
+        os.replace(tmp_path, hashes_path)
+        return digest.hexdigest()
+
+    def key(self, source_files, params):
+        """Return the key of the split of source_files with params (a json
+        serialisable dictionary)."""
+        description = {
+            'version': CACHE_VERSION,
+            'seed': DEFAULT_SEED,
+            'files': sorted(self.file_hash(path) for path in source_files),
+            'params': params}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def split_key(self, data_dir, which_set='train', which_year='09', fraction=1.0,
+                  max_time_steps=None, plus_minus_feats=False, compressed_sensing=False,
+                  projection='sparse', projection_dim=100, projection_seed=DEFAULT_SEED,
+                  num_folds=5, fold=0):
+        """Return the key of the split ASSISTDataProvider.train_validation_split
+        makes with these arguments."""
+        return self.key(
+            data_files(data_dir, which_set, which_year, plus_minus_feats),
+            {'which_set': which_set,
+             'which_year': which_year,
+             'fraction': fraction,
+             'max_time_steps': max_time_steps,
+             'plus_minus_feats': plus_minus_feats,
+             'compressed_sensing': compressed_sensing,
+             'projection': [projection, projection_dim, projection_seed]
+             if compressed_sensing else None,
+             'num_folds': num_folds,
+             'fold': fold})
+
+    def get(self, key):
+        """Return the directory of the entry key, or None if it is not
+        cached. Marks the entry as recently used."""
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return None
+        os.utime(entry, None)
+        return entry
+
+    def pin(self, key):
+        """Keep the entry key, e.g. while runs still have to read it."""
+        open(os.path.join(self.cache_dir, key + PIN_SUFFIX + str(os.getpid())), 'w').close()
+        self.pinned.add(key)
+
+    def unpin_all(self):
+        """Remove the pins of this object."""
+        for key in self.pinned:
+            try:
+                os.remove(os.path.join(self.cache_dir, key + PIN_SUFFIX + str(os.getpid())))
+            except FileNotFoundError:
+                pass
+        self.pinned.clear()
+
+    def pinned_keys(self):
+        """Return the keys pinned by live processes, removing the pins of
+        processes which exited."""
+        keys = set()
+        for name in os.listdir(self.cache_dir):
+            key, suffix, pid = name.rpartition(PIN_SUFFIX)
+            if not suffix or not pid.isdigit():
+                continue
+            if _process_exists(int(pid)):
+                keys.add(key)
+            else:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+        return keys
+
+    def put(self, key, splits):
+        """Save splits ({'train': data, 'valid': data}, see
+        ASSISTDataProvider.get_data) as entry key, then evict the least
+        recently used entries until the cache fits in max_bytes. Returns the
+        directory of the entry."""
+        entry = os.path.join(self.cache_dir, key)
+        tmp_entry = '{}.tmp-{}'.format(entry, os.getpid())
+        for name, data in splits.items():
+            save_provider_data(os.path.join(tmp_entry, name), data)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process cached the same split in the meantime
+            shutil.rmtree(tmp_entry)
+        self.evict(keep=key)
+        return entry
+
+    def evict(self, keep=None):
+        """Remove least recently used entries (except keep and the pinned
+        ones) until the total size is at most max_bytes. Returns the total
+        size of the remaining entries, which is larger than max_bytes if the
+        kept entries do not fit."""
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if os.path.isdir(os.path.join(self.cache_dir, name)) and '.tmp-' not in name]
+        entries.sort(key=os.path.getmtime)
+        pinned = self.pinned_keys()
+        sizes = {entry: _directory_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.basename(entry) == keep or os.path.basename(entry) in pinned:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+        return total
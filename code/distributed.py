@@ -0,0 +1,137 @@
+"""Synchronous data-parallel training of run_training.py over several
+processes.
+
+The variables live on a parameter server task and every worker task trains
+on its own shard of the students. The gradients of all workers are averaged
+with tf.train.SyncReplicasOptimizer before each update, so global_step, the
+learning rate schedule and the checkpoints (written by the chief, worker 0)
+are the same as for a single process run with num_workers times the batch
+size.
+
+The cluster is either given explicitly (--ps_hosts, --worker_hosts,
+--job_name and --task_index, one run_training.py per task, possibly on
+several hosts) or started on localhost with --num_workers.
+"""
+
+from process_utils import (available_cpus, cpu_slots, cpus_option, free_port,
+                           script_command, thread_capped_env, thread_options)
+
+import os
+import subprocess
+
+# options of the launching run which are not passed on to the tasks
+LAUNCHER_ONLY_OPTIONS = ['name', 'model_dir', 'num_workers', 'num_threads',
+                         'intra_op_threads', 'inter_op_threads', 'cpus', 'ps_hosts',
+                         'worker_hosts', 'job_name', 'task_index']
+
+
+def run_local_cluster(args, save_dir):
+    """Run one parameter server and args.num_workers workers on localhost
+    and wait for the workers to finish training.
+
+    Each worker gets args.num_threads threads, or an equal share of the
+    available cpus if args.num_threads is 0. The chief saves its model and
+    summaries to save_dir/worker_0."""
+    ps_hosts = 'localhost:{}'.format(free_port())
+    worker_hosts = ','.join('localhost:{}'.format(free_port())
+                            for _ in range(args.num_workers))
+    num_threads = args.num_threads or max(1, len(available_cpus()) // args.num_workers)
+    slots = cpu_slots(args.num_workers, num_threads)
+
+    def launch(job_name, task_index, cpus):
+        options = {key: value for key, value in vars(args).items()
+                   if key not in LAUNCHER_ONLY_OPTIONS}
+        options.update({
+            'name': '{}_{}'.format(job_name, task_index),
+            'model_dir': save_dir,
+            'ps_hosts': ps_hosts,
+            'worker_hosts': worker_hosts,
+            'job_name': job_name,
+            'task_index': task_index,
+            'cpus': cpus_option(cpus)})
+        options.update(thread_options(num_threads))
+        log = open(os.path.join(save_dir, '{}_{}.log'.format(job_name, task_index)), 'w')
+        process = subprocess.Popen(script_command('run_training.py', options),
+                                   stdout=log, stderr=subprocess.STDOUT,
+                                   env=thread_capped_env(num_threads))
+        return process, log
+
+    ps, ps_log = launch('ps', 0, None)
+    workers = [launch('worker', i, slots[i]) for i in range(args.num_workers)]
+    print('Training on {} local workers, {} threads each'.format(
+        args.num_workers, num_threads))
+
+    failed = []
+    for task_index, (process, log) in enumerate(workers):
+        if process.wait() != 0:
+            failed.append(task_index)
+        log.close()
+    ps.terminate()
+    ps.wait()
+    ps_log.close()
+
+    if failed:
+        print('Workers {} failed, see worker_<i>.log'.format(failed))
+    else:
+        print('Saved model at', os.path.join(save_dir, 'worker_0'))
+
+
+def start_server(args, config):
+    """Start the tf.train.Server of this task.
+
+    Returns the cluster spec and the server."""
+    import tensorflow as tf
+
+    cluster = tf.train.ClusterSpec({
+        'ps': args.ps_hosts.split(','),
+        'worker': args.worker_hosts.split(',')})
+    server = tf.train.Server(cluster,
+                             job_name=args.job_name,
+                             task_index=args.task_index,
+                             config=config)
+    return cluster, server
+
+
+def create_distributed_session(server, model, is_chief, config, init_op,
+                               restore_path=None):
+    """Create a session on server for a model built with num_replicas > 1.
+
+    The chief initialises (or restores) the variables and runs the queue
+    runner of the SyncReplicasOptimizer, the other workers wait until the
+    variables are ready. Returns the session and its tf.train.Supervisor,
+    which must be stopped once training finishes."""
+    import tensorflow as tf
+
+    optimizer = model.sync_optimizer
+    if is_chief:
+        local_init_op = optimizer.chief_init_op
+    else:
+        local_init_op = optimizer.local_step_init_op
+
+    init_fn = None
+    if restore_path:
+        saver = tf.train.Saver()
+
+        def init_fn(sess):
+            saver.restore(sess, tf.train.latest_checkpoint(restore_path))
+            print("Model restored!")
+
+    supervisor = tf.train.Supervisor(
+        is_chief=is_chief,
+        logdir=None,
+        init_op=init_op,
+        init_fn=init_fn,
+        local_init_op=local_init_op,
+        ready_for_local_init_op=optimizer.ready_for_local_init_op,
+        # the metric variables are (re-)initialised by each worker itself
+        ready_op=tf.report_uninitialized_variables(tf.global_variables()),
+        summary_op=None,
+        saver=None,
+        global_step=model.global_step,
+        recovery_wait_secs=1)
+    sess = supervisor.prepare_or_wait_for_session(server.target, config=config)
+
+    if is_chief:
+        sess.run(optimizer.get_init_tokens_op())
+        supervisor.start_queue_runners(sess, [optimizer.get_chief_queue_runner()])
+    return sess, supervisor
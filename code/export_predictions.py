@@ -0,0 +1,172 @@
+# Export the predicted probabilities of a trained model for every answer of
+# every student of a data set.
+#
+# Students are processed in order, in shards of --shard_size students. Each
+# shard is written to its own npz file in --output_dir as soon as it is
+# done, so memory use does not grow with the number of students, and
+# manifest.json lists the completed shards. If the export is interrupted,
+# running the same command again continues after the last completed shard.
+#
+# Every shard contains, in the order of the target_ids of the data provider
+# (student by student, answer by answer):
+#     predictions: predicted probability of a correct answer (float32)
+#     targets: the actual answers (int8)
+#     problem_ids: problem set id of each answer (int32)
+#     offsets: the answers of the i'th student of the shard are
+#         [offsets[i], offsets[i + 1])
+#     student_ids: index of each student of the shard in the data set
+# Whole sequences are fed to the model, i.e. they are not truncated to the
+# --max_time_steps the model was trained with.
+from perf_config import add_perf_config_arguments, get_perf_config, pin_cpus
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import json
+import os
+
+MANIFEST_FILENAME = 'manifest.json'
+
+parser = ArgumentParser(description='Export the predictions of a trained model.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--run_dir', type=str, required=True,
+                    help='Directory of the training run (containing args.json '
+                         'and the checkpoints)')
+parser.add_argument('--checkpoint', type=str, default=None,
+                    help='Checkpoint to restore. Defaults to the latest one in --run_dir')
+parser.add_argument('--data_dir', type=str, default=None,
+                    help='Path to directory containing data. Defaults to the '
+                         'data_dir of the training run')
+parser.add_argument('--which_set', type=str, default='test',
+                    help='Either train or test')
+parser.add_argument('--output_dir', type=str, required=True,
+                    help='Directory the shards and manifest are written to')
+parser.add_argument('--shard_size', type=int, default=5000,
+                    help='Number of students per shard')
+parser.add_argument('--batch', type=int, default=32,
+                    help='Batch size')
+add_perf_config_arguments(parser)
+args = parser.parse_args()
+
+args_path = os.path.join(args.run_dir, 'args.json')
+if not os.path.isfile(args_path):
+    parser.error('{} does not exist'.format(args_path))
+with open(args_path) as f:
+    run_args = json.load(f)
+data_dir = args.data_dir or run_args['data_dir']
+try:
+    perf_settings = get_perf_config(args)
+except (IOError, ValueError) as e:
+    parser.error(str(e))
+pin_cpus(perf_settings)
+
+from data_provider import ASSISTDataProvider
+from LstmModel import LstmModel
+from perf_config import apply_perf_config
+
+import numpy as np
+import tensorflow as tf
+
+checkpoint = args.checkpoint or tf.train.latest_checkpoint(args.run_dir)
+if checkpoint is None:
+    parser.error('No checkpoint found in {}'.format(args.run_dir))
+
+data_provider = ASSISTDataProvider(
+    data_dir,
+    which_set=args.which_set,
+    which_year=run_args['which_year'],
+    batch_size=args.batch,
+    use_plus_minus_feats=run_args['plus_minus_feats'],
+    use_compressed_sensing=run_args['compressed_sensing'],
+    projection=run_args.get('projection', 'sparse'),
+    projection_dim=run_args.get('projection_dim', 100),
+    projection_seed=run_args.get('projection_seed', 22012018),
+    shuffle_order=False)
+num_students = data_provider.inputs.shape[0]
+
+# the model must predict the same problem sets as the one in the checkpoint
+n_distinct_questions = tf.train.load_variable(checkpoint, 'RNN/sigmoid_b').shape[0]
+if n_distinct_questions != data_provider.max_prob_set_id:
+    parser.error('The model predicts {} problem sets, the {} data has {}'.format(
+        n_distinct_questions, args.which_set, data_provider.max_prob_set_id))
+
+manifest_path = os.path.join(args.output_dir, MANIFEST_FILENAME)
+description = {'checkpoint': os.path.abspath(checkpoint),
+               'data_dir': os.path.abspath(os.path.expanduser(data_dir)),
+               'which_set': args.which_set,
+               'num_students': num_students,
+               'shard_size': args.shard_size}
+if os.path.isfile(manifest_path):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if {key: manifest.get(key) for key in description} != description:
+        parser.error('{} belongs to a different export. Use another --output_dir'
+                     .format(manifest_path))
+else:
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    manifest = dict(description, shards=[])
+
+
+def save_manifest():
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+# models trained on packed sequences have a reset feature, which stays zero
+# with one student per row
+reset_channel = run_args.get('pack_sequences', False)
+model = LstmModel(max_time_steps=data_provider.max_num_ans,
+                  feature_len=data_provider.encoding_dim + int(reset_channel),
+                  n_distinct_questions=n_distinct_questions,
+                  var_dropout=run_args['var_dropout'],
+                  batch_size=args.batch,
+                  input_dtype=data_provider.inputs.dtype,
+                  reset_channel=reset_channel)
+model.build_inference_graph(n_hidden_units=run_args['num_hidden_units'])
+saver = tf.train.Saver()
+
+num_shards = -(-num_students // args.shard_size)
+with tf.Session(config=apply_perf_config(perf_settings)) as sess:
+    saver.restore(sess, checkpoint)
+    for shard in range(len(manifest['shards']), num_shards):
+        first, last = shard * args.shard_size, min((shard + 1) * args.shard_size, num_students)
+        predictions, problem_ids = [], []
+        for start in range(first, last, args.batch):
+            batch = slice(start, min(start + args.batch, last))
+            inputs, target_ids, targets = data_provider.transform_batch(
+                data_provider.inputs[batch], data_provider.target_ids[batch],
+                data_provider.targets[batch])
+            if reset_channel:
+                inputs = np.pad(inputs, ((0, 0), (0, 0), (0, 1)), 'constant')
+            predictions.append(sess.run(model.predictions,
+                                        feed_dict={model.inputs: inputs,
+                                                   model.target_ids: target_ids}))
+            # target_ids marks the problem set of each answer within the
+            # max_prob_set_id entries of its time step
+            problem_ids.append(
+                (np.flatnonzero(target_ids) % data_provider.max_prob_set_id + 1)
+                .astype(np.int32))
+
+        targets = data_provider.targets[first:last]
+        offsets = np.concatenate([[0], np.cumsum([len(student) for student in targets])])
+        filename = 'shard_{:05d}.npz'.format(shard)
+        tmp_path = os.path.join(args.output_dir, filename + '.tmp.npz')
+        np.savez(tmp_path,
+                 predictions=np.concatenate(predictions).astype(np.float32),
+                 targets=np.concatenate(targets).astype(np.int8),
+                 problem_ids=np.concatenate(problem_ids),
+                 offsets=offsets,
+                 student_ids=np.arange(first, last))
+        os.replace(tmp_path, os.path.join(args.output_dir, filename))
+        manifest['shards'].append({'file': filename,
+                                   'first_student': first,
+                                   'num_students': last - first,
+                                   'num_answers': int(offsets[-1])})
+        save_manifest()
+        print('Shard {}/{}: students {} to {}, {} answers'.format(
+            shard + 1, num_shards, first, last - 1, int(offsets[-1])))
+
+save_manifest()
+print('Exported predictions of {} students to {}'.format(num_students, args.output_dir))
@@ -0,0 +1,93 @@
+"""Batches for querying the knowledge state (mastery) of many students.
+
+The mastery of a student is the predicted probability of answering each
+problem set correctly given their whole history, i.e. the predictions of the
+model after their last answer (see LstmModel.build_mastery_graph). The
+inputs of the data set hold every answer of a student but the last one,
+whose problem set and mark are only stored in target_ids and targets, so
+last_answer_inputs encodes it in the same way to append it as a final step.
+
+Students are sorted by length and cut into batches whose dense inputs hold
+at most max_batch_steps steps, so each batch is run only up to the length
+of its longest student and the memory of a batch is bounded however long
+the sequences are.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def last_answer_inputs(provider):
+    """Return the encoding of the last answer of every student of provider
+    (a one student per row ASSISTDataProvider) as a CSR matrix of shape
+    (num_students, encoding_dim), with the dtype of provider.inputs. Rows of
+    students without targets are empty."""
+    num_students = provider.inputs.shape[0]
+    num_problems = provider.max_prob_set_id
+    target_ids = sp.csr_matrix(provider.target_ids)
+    students = np.flatnonzero(np.diff(target_ids.indptr) > 0)
+    # the column of the last target id of a student is that of its last step
+    last_columns = np.maximum.reduceat(target_ids.indices, target_ids.indptr[students]) \
+        if len(students) else np.zeros(0, dtype=np.int64)
+    problems = last_columns % num_problems + 1
+    marks = np.array([provider.targets[i][-1] for i in students], dtype=np.int64)
+
+    # see scripts/preprocess_assist_data.py
+    if provider.use_plus_minus_feats:
+        input_dim = num_problems + 1
+        columns, values = problems, 2 * marks - 1
+    else:
+        input_dim = 2 * num_problems + 1
+        columns, values = (1 - marks) * problems + marks * (num_problems + problems), \
+            np.ones(len(students))
+    inputs = sp.csr_matrix((values, (students, columns)), shape=(num_students, input_dim))
+    if provider.use_compressed_sensing:
+        from projection import projection_matrix
+
+        matrix = projection_matrix(provider.projection, input_dim,
+                                   provider.projection_dim, provider.projection_seed)
+        inputs = inputs.dot(matrix)
+    return sp.csr_matrix(inputs, dtype=provider.inputs.dtype)
+
+
+def history_lengths(provider):
+    """Number of answers of every student, including the last one."""
+    lengths = np.array([len(student) for student in provider.targets], dtype=np.int64)
+    # the first answer is only in the inputs, the last only in the targets
+    return np.where(lengths > 0, lengths + 1, 0)
+
+
+def length_sorted_batches(lengths, batch_size, max_batch_steps):
+    """Split the students into batches of similar length, longest first.
+    Every batch has at most batch_size students and, unless a single
+    student is longer, at most max_batch_steps steps when padded to its
+    longest student. Yields arrays of student indices."""
+    order = np.argsort(-lengths, kind='mergesort')
+    start = 0
+    while start < len(order):
+        longest = max(lengths[order[start]], 1)
+        size = int(min(batch_size, max(max_batch_steps // longest, 1)))
+        yield order[start:start + size]
+        start += size
+
+
+def history_batch(provider, students, last_inputs, reset_channel=False):
+    """Return the dense inputs, of shape (len(students), longest history,
+    encoding_dim), and the history lengths of students, with the last
+    answer of every student appended to its inputs. If reset_channel, a
+    zero feature is appended to every step, for models trained on packed
+    sequences (one student per row needs no reset)."""
+    num_steps = np.array([len(provider.targets[i]) for i in students], dtype=np.int64)
+    lengths = np.where(num_steps > 0, num_steps + 1, 0)
+    longest = max(int(lengths.max()), 1)
+    encoding_dim = provider.encoding_dim
+    inputs = np.zeros((len(students), longest, encoding_dim + int(reset_channel)),
+                      dtype=provider.inputs.dtype)
+    stored_steps = min(longest, provider.max_num_ans)
+    stored = provider.inputs[students][:, :stored_steps * encoding_dim].toarray()
+    inputs[:, :stored_steps, :encoding_dim] = stored.reshape(len(students), stored_steps,
+                                                             encoding_dim)
+    has_answers = num_steps > 0
+    inputs[np.flatnonzero(has_answers), num_steps[has_answers], :encoding_dim] = \
+        last_inputs[students[has_answers]].toarray()
+    return inputs, lengths.astype(np.int32)
@@ -0,0 +1,230 @@
+"""Choice of batch size and max_time_steps under a memory budget.
+
+The memory of a training step grows with the dense batches fed to the model:
+inputs of batch x max_time_steps x encoding_dim, target ids of
+batch x max_time_steps x max_prob_set_id and the logits of the same size,
+plus the LSTM activations kept for back-propagation. The planner
+
+    1. reads the shape of the data (max_num_ans, max_prob_set_id, the number
+       of answers of each student) without loading the inputs,
+    2. estimates the memory of every candidate (batch, max_time_steps),
+    3. runs a few training steps with synthetic batches of the most
+       promising candidates which fit the budget by estimate, each in a
+       fresh process (see probe), measuring peak memory and speed,
+    4. picks the candidate with the most answers per second whose measured
+       memory fits the budget.
+
+The decision, with all estimates and measurements, is saved as plan.json in
+the run directory.
+"""
+
+from process_utils import CODE_DIR
+
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+PLAN_FILENAME = 'plan.json'
+
+# rough number of float32 values of size n_hidden_units kept per time step
+# and student for the forward and backward pass of the LSTM (gates, cell
+# states, outputs, dropout masks and their gradients)
+LSTM_VALUES_PER_STEP = 24
+# students densified at once by ASSISTDataProvider._truncate_inputs_or_ids
+TRUNCATION_CHUNK = 1000
+
+
+def data_shape(data_dir, which_set='train', which_year='09', fraction=1.0,
+               plus_minus_feats=False, compressed_sensing=False, projection_dim=100,
+               pack_sequences=False):
+    """Return the dimensions of the data and the number of answers of each
+    student, reading only the targets file."""
+    data_path = os.path.join(os.path.expanduser(data_dir),
+                             'assist{0}-{1}'.format(which_year, which_set))
+    loaded = np.load(data_path + '-targets.npz', allow_pickle=True)
+    max_prob_set_id = int(loaded['max_prob_set_id'])
+    lengths = np.array([len(student) for student in loaded['targets']], dtype=np.int64)
+    lengths = lengths[:int(len(lengths) * fraction)]
+    if compressed_sensing:
+        encoding_dim = projection_dim
+    elif plus_minus_feats:
+        encoding_dim = max_prob_set_id + 1
+    else:
+        encoding_dim = 2 * max_prob_set_id + 1
+    return {'max_num_ans': int(loaded['max_num_ans']),
+            'max_prob_set_id': max_prob_set_id,
+            'encoding_dim': encoding_dim + (1 if pack_sequences else 0),
+            'input_itemsize': 4 if compressed_sensing else 1,
+            'compressed_sensing': compressed_sensing,
+            'projection_dim': projection_dim,
+            'pack_sequences': pack_sequences,
+            'lengths': lengths}
+
+
+def answer_fraction(lengths, max_time_steps, pack_sequences=False):
+    """Fraction of the time steps fed to the model which hold answers, when
+    sequences are cut into chunks of max_time_steps."""
+    if pack_sequences:
+        # packed rows are nearly full
+        return 1.
+    num_rows = np.sum(-(-lengths // max_time_steps))
+    return float(lengths.sum()) / max(num_rows * max_time_steps, 1)
+
+
+def estimate_memory(shape, batch, max_time_steps, n_hidden_units):
+    """Estimate the bytes used by the data and by one training step.
+
+    Returns a dictionary with the estimated bytes of the data held by the
+    providers, of the preprocessing peak, of the host-side batch, of the
+    graph and their total."""
+    B, T = batch, max_time_steps
+    E, Q, H = shape['encoding_dim'], shape['max_prob_set_id'], n_hidden_units
+    num_answers = int(shape['lengths'].sum())
+    # nonzeros of the sparse inputs and target ids: 1 per answer, or
+    # projection_dim if compressed. data plus int32 column index
+    input_nnz = num_answers * (shape['projection_dim'] if shape['compressed_sensing'] else 1)
+    data_bytes = input_nnz * (shape['input_itemsize'] + 4) + num_answers * (1 + 4 + 1)
+    # truncation densifies chunks of students and pads them (2 copies)
+    max_num_ans = shape['max_num_ans']
+    preprocessing_bytes = 2 * min(TRUNCATION_CHUNK, len(shape['lengths'])) * max_num_ans * max(
+        E * shape['input_itemsize'], Q)
+    # dense batch: int8 inputs (or float32) and target ids, the int32 copy
+    # of the target ids, and the copies TensorFlow makes when feeding them
+    host_bytes = 2 * B * T * (E * shape['input_itemsize'] + Q * 4) + B * T * Q
+    # float32 inputs, LSTM activations, logits (and their gradient) in the graph
+    graph_bytes = 4 * B * T * (E + LSTM_VALUES_PER_STEP * H + 3 * Q)
+    step_bytes = host_bytes + graph_bytes
+    return {'data_bytes': data_bytes,
+            'preprocessing_bytes': preprocessing_bytes,
+            'host_bytes': host_bytes,
+            'graph_bytes': graph_bytes,
+            'total_bytes': data_bytes + max(preprocessing_bytes, step_bytes)}
+
+
+def probe(shape, batch, max_time_steps, n_hidden_units, optimisation='sgd', steps=5):
+    """Run a few training steps of the given configuration with synthetic
+    batches in a fresh process. Returns its peak resident memory in bytes
+    and the training steps per second, or a dictionary with an error."""
+    config = {'batch': batch,
+              'max_time_steps': max_time_steps,
+              'encoding_dim': shape['encoding_dim'],
+              'input_itemsize': shape['input_itemsize'],
+              'max_prob_set_id': shape['max_prob_set_id'],
+              'n_hidden_units': n_hidden_units,
+              'optimisation': optimisation,
+              'steps': steps}
+    command = [sys.executable, os.path.join(CODE_DIR, 'memory_planner.py'),
+               '--probe', json.dumps(config)]
+    try:
+        output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+        return json.loads(output.decode().strip().splitlines()[-1])
+    except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+        # e.g. the probe was killed because it ran out of memory
+        return {'error': str(e)}
+
+
+def _run_probe(config):
+    """Body of probe, run in the child process."""
+    from LstmModel import LstmModel
+    from profiling import peak_rss_mb, reset_peak_rss
+    from time import time
+    import tensorflow as tf
+
+    B, T = config['batch'], config['max_time_steps']
+    E, Q = config['encoding_dim'], config['max_prob_set_id']
+    input_dtype = np.float32 if config['input_itemsize'] == 4 else np.int8
+    model = LstmModel(max_time_steps=T, feature_len=E, n_distinct_questions=Q,
+                      batch_size=B, input_dtype=input_dtype)
+    model.build_graph(n_hidden_units=config['n_hidden_units'],
+                      optimisation=config['optimisation'])
+
+    # full-length students: the memory of a step does not depend on the
+    # number of answers, as batches are dense
+    rng = np.random.RandomState(0)
+    inputs = np.zeros((B, T, E), dtype=input_dtype)
+    inputs[np.arange(B)[:, None], np.arange(T)[None, :], rng.randint(E, size=(B, T))] = 1
+    target_ids = np.zeros((B, T, Q), dtype=np.int32)
+    target_ids[np.arange(B)[:, None], np.arange(T)[None, :], rng.randint(Q, size=(B, T))] = 1
+    target_ids = target_ids.reshape(-1)
+    targets = rng.randint(2, size=B * T).astype(np.float32)
+
+    reset_peak_rss()
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        feed_dict = {model.inputs: inputs, model.targets: targets,
+                     model.target_ids: target_ids, model.learning_rate: 0.1}
+        sess.run(model.training, feed_dict=feed_dict)  # warm up
+        start = time()
+        for _ in range(config['steps']):
+            sess.run(model.training, feed_dict=feed_dict)
+        elapsed = time() - start
+    return {'peak_bytes': int(peak_rss_mb() * 2**20),
+            'steps_per_sec': config['steps'] / elapsed}
+
+
+def plan(shape, budget_bytes, batches, time_steps, n_hidden_units, optimisation='sgd',
+         max_probes=4):
+    """Return the plan for the fastest (batch, max_time_steps) out of the
+    candidates which fits budget_bytes (see the module docstring).
+
+    The plan is a dictionary with the chosen 'batch' and 'max_time_steps',
+    and the estimates and probe results of all candidates. If no candidate
+    fits, the one with the smallest estimate is chosen and 'fits' is False."""
+    candidates = []
+    for max_time_steps in sorted(set(min(t, shape['max_num_ans']) for t in time_steps)):
+        fraction = answer_fraction(shape['lengths'], max_time_steps, shape['pack_sequences'])
+        for batch in sorted(set(batches)):
+            estimate = estimate_memory(shape, batch, max_time_steps, n_hidden_units)
+            candidates.append({'batch': batch,
+                               'max_time_steps': max_time_steps,
+                               'answer_fraction': fraction,
+                               'answers_per_step': batch * max_time_steps * fraction,
+                               'estimate': estimate,
+                               'fits_estimate': estimate['total_bytes'] <= budget_bytes})
+
+    # probe the candidates which process the most answers per step first
+    to_probe = sorted([c for c in candidates if c['fits_estimate']],
+                      key=lambda c: -c['answers_per_step'])[:max_probes]
+    for candidate in to_probe:
+        result = probe(shape, candidate['batch'], candidate['max_time_steps'],
+                       n_hidden_units, optimisation)
+        candidate['probe'] = result
+        if 'error' in result:
+            continue
+        estimate = candidate['estimate']
+        # the probe does not hold the data set, so add its estimate
+        candidate['measured_bytes'] = estimate['data_bytes'] + max(
+            estimate['preprocessing_bytes'], result['peak_bytes'])
+        candidate['answers_per_sec'] = result['steps_per_sec'] * candidate['answers_per_step']
+        print('Probed batch {:>4}, max_time_steps {:>4}: {:>8.0f} MB, {:>8.0f} answers/sec'
+              .format(candidate['batch'], candidate['max_time_steps'],
+                      candidate['measured_bytes'] / 2**20, candidate['answers_per_sec']))
+
+    fitting = [c for c in to_probe if c.get('measured_bytes', np.inf) <= budget_bytes]
+    if fitting:
+        chosen = max(fitting, key=lambda c: c['answers_per_sec'])
+    else:
+        chosen = min(candidates, key=lambda c: c['estimate']['total_bytes'])
+    return {'budget_bytes': budget_bytes,
+            'batch': chosen['batch'],
+            'max_time_steps': chosen['max_time_steps'],
+            'fits': bool(fitting),
+            'shape': {key: value for key, value in shape.items() if key != 'lengths'},
+            'num_students': len(shape['lengths']),
+            'num_answers': int(shape['lengths'].sum()),
+            'n_hidden_units': n_hidden_units,
+            'candidates': candidates}
+
+
+def save_plan(save_dir, run_plan):
+    with open(os.path.join(save_dir, PLAN_FILENAME), 'w') as f:
+        json.dump(run_plan, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    # internal: python memory_planner.py --probe <json config>
+    if len(sys.argv) != 3 or sys.argv[1] != '--probe':
+        sys.exit('usage: memory_planner.py --probe <json config>')
+    print(json.dumps(_run_probe(json.loads(sys.argv[2]))))
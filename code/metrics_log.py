@@ -0,0 +1,50 @@
+"""Per-epoch metrics of a training run, stored as a small csv file in the run
+directory.
+
+Rows are appended as training goes on, so the log of an interrupted run is
+still complete up to its last epoch. Reading the log only needs numpy, so
+learning curves and comparisons of many runs do not have to import
+TensorFlow or scan event files.
+"""
+
+import csv
+import os
+import numpy as np
+
+METRICS_FILENAME = 'metrics.csv'
+COLUMNS = ['epoch', 'split', 'loss', 'accuracy', 'auc', 'learning_rate', 'wall_time']
+
+
+class MetricsLog(object):
+    """Appends one row per epoch and split to save_dir/metrics.csv."""
+
+    def __init__(self, save_dir, filename=METRICS_FILENAME):
+        self.path = os.path.join(save_dir, filename)
+        if not os.path.isfile(self.path):
+            with open(self.path, 'w') as f:
+                csv.writer(f).writerow(COLUMNS)
+
+    def append(self, epoch, split, loss, accuracy, auc, learning_rate=None,
+               wall_time=None):
+        row = [epoch, split, loss, accuracy, auc, learning_rate, wall_time]
+        with open(self.path, 'a') as f:
+            csv.writer(f).writerow(['' if value is None else value for value in row])
+
+
+def read_metrics(save_dir, filename=METRICS_FILENAME):
+    """Return the metrics log of a run as {split: {column: array}}, with the
+    rows of each split in epoch order. Missing values are nan."""
+    columns = {}
+    with open(os.path.join(save_dir, filename)) as f:
+        for row in csv.DictReader(f):
+            split = columns.setdefault(row['split'], {name: [] for name in COLUMNS
+                                                      if name != 'split'})
+            for name, values in split.items():
+                values.append(float(row[name]) if row[name] else np.nan)
+
+    metrics = {}
+    for split, values in columns.items():
+        order = np.argsort(values['epoch'], kind='mergesort')
+        metrics[split] = {name: np.array(column)[order] for name, column in values.items()}
+        metrics[split]['epoch'] = metrics[split]['epoch'].astype(int)
+    return metrics
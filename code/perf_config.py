@@ -0,0 +1,129 @@
+"""Performance settings of TensorFlow sessions.
+
+The settings can be given as command line flags and/or as a json config
+file with the same keys, e.g.
+
+    {"intra_op_threads": 8, "inter_op_threads": 2,
+     "graph_opt_level": "L1", "xla": true, "cpus": "0-7"}
+
+Flags override the values of the config file.
+
+TensorFlow is only imported when the session config is built, so the flags
+can be added to parsers of scripts which do not need it.
+"""
+
+import json
+import os
+
+DEFAULT_PERF_CONFIG = {
+    'num_threads': 0,
+    'intra_op_threads': None,
+    'inter_op_threads': None,
+    'graph_opt_level': 'default',
+    'xla': False,
+    'cpus': None}
+
+GRAPH_OPT_LEVELS = ['default', 'L0', 'L1']
+
+
+def add_perf_config_arguments(parser):
+    """Add the performance flags to an argparse parser.
+
+    All defaults are None, so that it is possible to tell which flags were
+    given and should override the config file."""
+    parser.add_argument('--perf_config', type=str, default=None,
+                        help='Path to json file with performance settings')
+    parser.add_argument('--num_threads', type=int, default=None,
+                        help='Number of intra-op and inter-op threads used by '
+                             'TensorFlow. 0 lets TensorFlow decide')
+    parser.add_argument('--intra_op_threads', type=int, default=None,
+                        help='Threads used to run a single op. '
+                             'Overrides --num_threads')
+    parser.add_argument('--inter_op_threads', type=int, default=None,
+                        help='Threads used to run independent ops. '
+                             'Overrides --num_threads')
+    parser.add_argument('--graph_opt_level', type=str, default=None,
+                        choices=GRAPH_OPT_LEVELS,
+                        help='Graph optimisation level. L0 disables common '
+                             'subexpression elimination and constant folding')
+    parser.add_argument('--xla', dest='xla', action='store_true', default=None,
+                        help='compile the graph with the XLA JIT')
+    parser.add_argument('--no-xla', dest='xla', action='store_false',
+                        help='do not use the XLA JIT')
+    parser.add_argument('--cpus', type=str, default=None,
+                        help='Pin the process to these cpus, e.g. 0-7,16')
+
+
+def get_perf_config(args):
+    """Return the performance settings given by the config file and flags
+    of args."""
+    settings = dict(DEFAULT_PERF_CONFIG)
+    if args.perf_config:
+        with open(args.perf_config) as f:
+            loaded = json.load(f)
+        unknown = set(loaded) - set(DEFAULT_PERF_CONFIG)
+        if unknown:
+            raise ValueError('Unknown performance settings in {}: {}'.format(
+                args.perf_config, sorted(unknown)))
+        settings.update(loaded)
+    for key in DEFAULT_PERF_CONFIG:
+        if getattr(args, key, None) is not None:
+            settings[key] = getattr(args, key)
+    if settings['graph_opt_level'] not in GRAPH_OPT_LEVELS:
+        raise ValueError('graph_opt_level must be one of {}. Got {}'.format(
+            GRAPH_OPT_LEVELS, settings['graph_opt_level']))
+    return settings
+
+
+def parse_cpus(cpus):
+    """Turn a cpu list such as '0-3,8' into a list of ints."""
+    result = []
+    for part in cpus.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            result.extend(range(int(first), int(last) + 1))
+        else:
+            result.append(int(part))
+    return result
+
+
+def pin_cpus(settings):
+    """Pin this process to the cpus of the settings, if any."""
+    if settings['cpus']:
+        os.sched_setaffinity(0, parse_cpus(settings['cpus']))
+
+
+def apply_perf_config(settings):
+    """Apply the process-wide settings (cpu pinning) and return the
+    tf.ConfigProto for the sessions of this process."""
+    import tensorflow as tf
+
+    pin_cpus(settings)
+    intra_op_threads = settings['intra_op_threads']
+    inter_op_threads = settings['inter_op_threads']
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=settings['num_threads'] if intra_op_threads is None
+        else intra_op_threads,
+        inter_op_parallelism_threads=settings['num_threads'] if inter_op_threads is None
+        else inter_op_threads)
+
+    optimizer_options = config.graph_options.optimizer_options
+    if settings['graph_opt_level'] == 'L0':
+        optimizer_options.opt_level = tf.OptimizerOptions.L0
+    elif settings['graph_opt_level'] == 'L1':
+        optimizer_options.opt_level = tf.OptimizerOptions.L1
+    if settings['xla']:
+        optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    return config
+
+
+def save_perf_config(save_dir, settings, config):
+    """Record the chosen settings, and the resulting session config, in
+    save_dir/perf_config.json."""
+    record = dict(settings)
+    record['intra_op_parallelism_threads'] = config.intra_op_parallelism_threads
+    record['inter_op_parallelism_threads'] = config.inter_op_parallelism_threads
+    if hasattr(os, 'sched_getaffinity'):
+        record['affinity'] = sorted(os.sched_getaffinity(0))
+    with open(os.path.join(save_dir, 'perf_config.json'), 'w') as f:
+        json.dump(record, f, indent=2, sort_keys=True)
@@ -0,0 +1,90 @@
+"""Helpers for running the training scripts in child processes.
+
+Used by the drivers which launch several runs of run_training.py at once,
+e.g. hyperparameter sweeps.
+"""
+
+import os
+import socket
+import sys
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def script_command(script, options):
+    """Return the command line for running one of the scripts in this
+    directory with the given options.
+
+    Boolean options are turned into the --name / --no-name flag pairs used
+    by run_training.py, None values are left out."""
+    command = [sys.executable, os.path.join(CODE_DIR, script)]
+    for name, value in sorted(options.items()):
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            command.append('--{}'.format(name) if value else '--no-{}'.format(name))
+        else:
+            command.extend(['--{}'.format(name), str(value)])
+    return command
+
+
+def thread_capped_env(num_threads, env=None):
+    """Return a copy of env (default: os.environ) which limits the number of
+    threads used by the numerical libraries of a child process.
+
+    TensorFlow's own thread pools are capped with --num_threads, this caps
+    the OpenMP/BLAS pools used by numpy, scipy and MKL builds of TensorFlow.
+    Output is unbuffered so the parent can follow the progress of the child."""
+    env = dict(os.environ if env is None else env)
+    if num_threads:
+        for name in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+            env[name] = str(num_threads)
+    env['PYTHONUNBUFFERED'] = '1'
+    return env
+
+
+def thread_options(num_threads):
+    """Return the options (see perf_config) giving a child run num_threads
+    TensorFlow threads. The intra-op and inter-op threads are set as well,
+    as they would otherwise override the cap with the values of the parent
+    or of a --perf_config file."""
+    return {'num_threads': num_threads,
+            'intra_op_threads': num_threads,
+            'inter_op_threads': num_threads}
+
+
+def available_cpus():
+    """Return a sorted list of the cpus this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_slots(num_slots, cpus_per_slot):
+    """Split the available cpus into num_slots disjoint lists of
+    cpus_per_slot cpus. Returns None for every slot if there are not enough
+    cpus to give each slot its own cores."""
+    cpus = available_cpus()
+    if not hasattr(os, 'sched_setaffinity') or num_slots * cpus_per_slot > len(cpus):
+        return [None] * num_slots
+    return [cpus[i * cpus_per_slot:(i + 1) * cpus_per_slot]
+            for i in range(num_slots)]
+
+
+def cpus_option(cpus):
+    """Return the value of the --cpus option (see perf_config) which pins a
+    child run to the given cpus, or None (no option) if cpus is None.
+
+    The child pins itself before it starts any threads. Pinning it with a
+    preexec_fn instead is not safe, as the parents starting the runs have
+    several threads."""
+    if cpus is None:
+        return None
+    return ','.join(str(cpu) for cpu in cpus)
+
+
+def free_port():
+    """Return a tcp port on localhost that is currently unused."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
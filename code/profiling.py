@@ -0,0 +1,126 @@
+"""Timing and memory instrumentation of the training loop."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+
+import json
+import os
+import resource
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of this process, so that the peak of
+    each epoch can be measured. Only supported on Linux; returns False if
+    the peak could not be reset."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB since the last
+    reset_peak_rss. Falls back to the lifetime peak where /proc is not
+    available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except (IOError, OSError):
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+class StepTimer(object):
+    """Accumulates the wall-clock time of each phase of the training loop
+    (e.g. data loading, feed preparation and sess.run) together with the
+    number of students and answers processed."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start a new measurement period, e.g. an epoch."""
+        self.phase_seconds = OrderedDict()
+        self.num_steps = 0
+        self.num_students = 0
+        self.num_answers = 0
+        self.start_time = time()
+        reset_peak_rss()
+
+    def add(self, name, seconds):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager timing the code it wraps as phase name."""
+        start = time()
+        yield
+        self.add(name, time() - start)
+
+    def timed_iter(self, iterable, name='data'):
+        """Iterate over iterable, timing each call to next as phase name."""
+        iterator = iter(iterable)
+        while True:
+            start = time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time() - start)
+                return
+            self.add(name, time() - start)
+            yield item
+
+    def count_step(self, num_students, num_answers):
+        self.num_steps += 1
+        self.num_students += num_students
+        self.num_answers += num_answers
+
+    def summary(self, step_phases=('data', 'feed', 'compute', 'sampler')):
+        """Return a dictionary with the seconds spent in each phase, the
+        throughput over the step_phases and the peak memory."""
+        result = OrderedDict(
+            ('{}_sec'.format(name), seconds)
+            for name, seconds in self.phase_seconds.items())
+        step_seconds = sum(self.phase_seconds.get(name, 0.) for name in step_phases)
+        result['wall_sec'] = time() - self.start_time
+        result['steps'] = self.num_steps
+        result['students'] = self.num_students
+        result['answers'] = self.num_answers
+        if step_seconds > 0:
+            result['steps_per_sec'] = self.num_steps / step_seconds
+            result['students_per_sec'] = self.num_students / step_seconds
+            result['answers_per_sec'] = self.num_answers / step_seconds
+        result['peak_rss_mb'] = peak_rss_mb()
+        return result
+
+
+def summary_proto(values, prefix='perf'):
+    """Turn a dictionary of numbers into a tf.Summary of scalars, which can
+    be written with the FileWriter of the other summaries."""
+    import tensorflow as tf
+
+    return tf.Summary(value=[
+        tf.Summary.Value(tag='{}/{}'.format(prefix, name), simple_value=float(value))
+        for name, value in values.items()])
+
+
+def save_timings(save_dir, timings):
+    """Write the list of per-epoch timing summaries to save_dir/timing.json."""
+    with open(os.path.join(save_dir, 'timing.json'), 'w') as f:
+        json.dump(timings, f, indent=2)
+
+
+def save_trace(run_metadata, path):
+    """Save the step stats of a traced sess.run as a Chrome trace
+    (open it at chrome://tracing)."""
+    from tensorflow.python.client import timeline
+
+    trace = timeline.Timeline(run_metadata.step_stats)
+    with open(path, 'w') as f:
+        f.write(trace.generate_chrome_trace_format())
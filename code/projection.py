@@ -0,0 +1,66 @@
+"""Seeded sparse random projections of the input encodings.
+
+Compressed sensing maps the encoding of every answer (of length
+encoding_dim) to a lower dimensional vector. Instead of drawing and storing
+a dense Gaussian matrix, the projection matrix is a sparse matrix which is
+regenerated from its kind, dimensions and seed whenever it is needed, and
+applied to the sparse inputs as a sparse product. Only those parameters
+need to be stored (in the args.json of a training run), so the same
+projection can be used at test time.
+
+Two kinds are available:
+    sparse: very sparse random projection (Achlioptas 2003, Li et al. 2006).
+        Entries are +-sqrt(s / projection_dim) with probability 1 / (2s)
+        each and 0 otherwise, with s = sqrt(input_dim).
+    hashed: feature hashing. Every input feature is added, with a random
+        sign, to a single randomly chosen output dimension.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+PROJECTIONS = ['sparse', 'hashed']
+
+
+def sparse_projection_matrix(input_dim, output_dim, seed):
+    """Return a very sparse random projection matrix of shape
+    (input_dim, output_dim) in CSR format."""
+    rng = np.random.RandomState(seed)
+    s = np.sqrt(input_dim)
+    scale = np.sqrt(s / output_dim)
+    num_nonzero = rng.binomial(input_dim * output_dim, 1. / s)
+    positions = rng.choice(input_dim * output_dim, size=num_nonzero, replace=False)
+    values = scale * rng.choice([-1., 1.], size=num_nonzero)
+    return sp.csr_matrix((values, (positions // output_dim, positions % output_dim)),
+                         shape=(input_dim, output_dim))
+
+
+def hashed_projection_matrix(input_dim, output_dim, seed):
+    """Return a feature hashing matrix of shape (input_dim, output_dim) in
+    CSR format, with a single +-1 entry per row."""
+    rng = np.random.RandomState(seed)
+    columns = rng.randint(output_dim, size=input_dim)
+    signs = rng.choice([-1., 1.], size=input_dim)
+    return sp.csr_matrix((signs, (np.arange(input_dim), columns)),
+                         shape=(input_dim, output_dim))
+
+
+def projection_matrix(kind, input_dim, output_dim, seed):
+    assert kind in PROJECTIONS, (
+        'Expected projection to be one of {}. Got {}'.format(PROJECTIONS, kind)
+    )
+    if kind == 'sparse':
+        return sparse_projection_matrix(input_dim, output_dim, seed)
+    return hashed_projection_matrix(input_dim, output_dim, seed)
+
+
+def project_inputs(inputs, encoding_dim, matrix):
+    """Project the encoding of every answer in inputs, a sparse matrix of
+    shape (num_students, max_num_ans * encoding_dim). Returns a float32 CSR
+    matrix of shape (num_students, max_num_ans * output_dim).
+
+    Padding answers (all zero) stay all zero."""
+    num_students = inputs.shape[0]
+    answers = sp.csr_matrix(inputs, dtype=np.float32).reshape((-1, encoding_dim)).tocsr()
+    projected = answers.dot(matrix.astype(np.float32))
+    return sp.csr_matrix(projected.reshape((num_students, -1)))
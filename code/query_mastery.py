@@ -0,0 +1,147 @@
+# Query the knowledge state of every student of a data set with a trained
+# model: the mastery matrix of shape (students, problem sets), whose row i is
+# the predicted probability of student i answering each problem set
+# correctly given their whole history (see mastery.py).
+#
+# The matrix is written to --output as a .npy file through a memory map, one
+# batch of students at a time, so memory use does not grow with the number
+# of students. Rows are in the order of the students of the data set.
+# Students are batched by length and the model only computes predictions
+# after the last answer of each student, which makes a refresh over all
+# students much cheaper than exporting every prediction. --problems
+# restricts the columns to some problem sets; the problem set ids of the
+# columns are saved next to the matrix, in <output>.json.
+from perf_config import add_perf_config_arguments, get_perf_config, pin_cpus
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from time import time
+
+import json
+import os
+
+parser = ArgumentParser(description='Query the mastery matrix of a data set.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--run_dir', type=str, required=True,
+                    help='Directory of the training run (containing args.json '
+                         'and the checkpoints)')
+parser.add_argument('--checkpoint', type=str, default=None,
+                    help='Checkpoint to restore. Defaults to the latest one in --run_dir')
+parser.add_argument('--data_dir', type=str, default=None,
+                    help='Path to directory containing data. Defaults to the '
+                         'data_dir of the training run')
+parser.add_argument('--which_set', type=str, default='train',
+                    help='Either train or test')
+parser.add_argument('--output', type=str, required=True,
+                    help='.npy file the mastery matrix is written to')
+parser.add_argument('--problems', type=str, default=None,
+                    help='Comma-separated problem set ids (1 based) to query. '
+                         'Defaults to all problem sets')
+parser.add_argument('--dtype', type=str, default='float16',
+                    choices=['float16', 'float32'],
+                    help='dtype of the mastery matrix')
+parser.add_argument('--batch', type=int, default=256,
+                    help='Maximum number of students per batch')
+parser.add_argument('--max_batch_steps', type=int, default=100000,
+                    help='Maximum number of (padded) time steps per batch, which '
+                         'bounds the memory of a batch')
+add_perf_config_arguments(parser)
+args = parser.parse_args()
+
+args_path = os.path.join(args.run_dir, 'args.json')
+if not os.path.isfile(args_path):
+    parser.error('{} does not exist'.format(args_path))
+with open(args_path) as f:
+    run_args = json.load(f)
+data_dir = args.data_dir or run_args['data_dir']
+try:
+    problems = [int(x) for x in args.problems.split(',')] if args.problems else None
+except ValueError:
+    parser.error('--problems must be comma-separated integers')
+try:
+    perf_settings = get_perf_config(args)
+except (IOError, ValueError) as e:
+    parser.error(str(e))
+pin_cpus(perf_settings)
+
+from data_provider import ASSISTDataProvider
+from LstmModel import LstmModel
+from mastery import history_batch, history_lengths, last_answer_inputs, \
+    length_sorted_batches
+from perf_config import apply_perf_config
+
+import numpy as np
+import tensorflow as tf
+
+checkpoint = args.checkpoint or tf.train.latest_checkpoint(args.run_dir)
+if checkpoint is None:
+    parser.error('No checkpoint found in {}'.format(args.run_dir))
+
+data_provider = ASSISTDataProvider(
+    data_dir,
+    which_set=args.which_set,
+    which_year=run_args['which_year'],
+    batch_size=args.batch,
+    use_plus_minus_feats=run_args['plus_minus_feats'],
+    use_compressed_sensing=run_args['compressed_sensing'],
+    projection=run_args.get('projection', 'sparse'),
+    projection_dim=run_args.get('projection_dim', 100),
+    projection_seed=run_args.get('projection_seed', 22012018),
+    shuffle_order=False)
+num_students = data_provider.inputs.shape[0]
+
+# the model must predict the same problem sets as the one in the checkpoint
+n_distinct_questions = tf.train.load_variable(checkpoint, 'RNN/sigmoid_b').shape[0]
+if n_distinct_questions != data_provider.max_prob_set_id:
+    parser.error('The model predicts {} problem sets, the {} data has {}'.format(
+        n_distinct_questions, args.which_set, data_provider.max_prob_set_id))
+if problems is None:
+    problems = list(range(1, n_distinct_questions + 1))
+elif not all(1 <= problem <= n_distinct_questions for problem in problems):
+    parser.error('--problems must be in [1, {}]'.format(n_distinct_questions))
+
+# models trained on packed sequences have a reset feature
+reset_channel = run_args.get('pack_sequences', False)
+model = LstmModel(max_time_steps=None,
+                  feature_len=data_provider.encoding_dim + int(reset_channel),
+                  n_distinct_questions=n_distinct_questions,
+                  var_dropout=run_args['var_dropout'],
+                  batch_size=args.batch,
+                  input_dtype=data_provider.inputs.dtype,
+                  reset_channel=reset_channel)
+model.build_mastery_graph(n_hidden_units=run_args['num_hidden_units'])
+saver = tf.train.Saver()
+
+output_dir = os.path.dirname(os.path.abspath(args.output))
+if not os.path.isdir(output_dir):
+    os.makedirs(output_dir)
+mastery = np.lib.format.open_memmap(args.output, mode='w+', dtype=args.dtype,
+                                    shape=(num_students, len(problems)))
+
+last_inputs = last_answer_inputs(data_provider)
+lengths = history_lengths(data_provider)
+columns = np.array(problems, dtype=np.int32) - 1
+start = time()
+with tf.Session(config=apply_perf_config(perf_settings)) as sess:
+    saver.restore(sess, checkpoint)
+    num_done = 0
+    for students in length_sorted_batches(lengths, args.batch, args.max_batch_steps):
+        inputs, batch_lengths = history_batch(data_provider, students, last_inputs,
+                                              reset_channel)
+        mastery[students] = sess.run(model.mastery,
+                                     feed_dict={model.inputs: inputs,
+                                                model.lengths: batch_lengths,
+                                                model.mastery_columns: columns})
+        num_done += len(students)
+        print('{}/{} students'.format(num_done, num_students), end='\r', flush=True)
+mastery.flush()
+del mastery
+
+with open(args.output + '.json', 'w') as f:
+    json.dump({'checkpoint': os.path.abspath(checkpoint),
+               'data_dir': os.path.abspath(os.path.expanduser(data_dir)),
+               'which_set': args.which_set,
+               'num_students': num_students,
+               'dtype': args.dtype,
+               'problem_ids': problems}, f, indent=2, sort_keys=True)
+print('Wrote the mastery of {} students for {} problem sets to {} in {:.0f}s'.format(
+    num_students, len(problems), args.output, time() - start))
@@ -0,0 +1,261 @@
+from data_provider import DEFAULT_SEED, ASSISTDataProvider
+from dataset_cache import DatasetCache
+from process_utils import cpu_slots, cpus_option, script_command, thread_capped_env, \
+    thread_options
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from time import gmtime, strftime, time
+
+import csv
+import itertools
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import numpy as np
+
+START_TIME = strftime('%Y%m%d-%H%M', gmtime())
+
+# a spec is a json file such as:
+# {
+#     "fixed": {"optimisation": "adam", "fraction": 0.5},
+#     "grid": {"num_hidden_units": [100, 200], "max_time_steps": [50, 100]},
+#     "random": {"init_learn_rate": {"loguniform": [0.001, 1.0]},
+#                "keep_prob": {"uniform": [0.4, 0.9]}},
+#     "num_trials": 10
+# }
+# Every combination of the "grid" values is run. If "random" is given,
+# "num_trials" random samples are drawn for every grid point. The options the
+# sweep sets for every trial (SWEEP_OPTIONS, e.g. epochs, which is --epochs)
+# cannot be in a spec.
+SWEEP_OPTIONS = ['data_dir', 'which_set', 'which_year', 'model_dir', 'name', 'epochs',
+                 'split_dir', 'cpus', 'num_threads', 'intra_op_threads', 'inter_op_threads']
+parser = ArgumentParser(description='Run a hyperparameter sweep over run_training.py.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--spec', type=str, required=True,
+                    help='Path to json file describing the search space')
+parser.add_argument('--data_dir', type=str,
+                    default='/afs/inf.ed.ac.uk/user/s17/s1771906/MLP/mlp-group-project/data',
+                    help='Path to directory containing data')
+parser.add_argument('--which_year', type=str, default='09',
+                    help='Year of ASSIST data. Either 09 or 15')
+parser.add_argument('--name', type=str, default='sweep-' + START_TIME,
+                    help='Name of the sweep')
+parser.add_argument('--model_dir', type=str, default='.',
+                    help='Path to directory where the sweep will be saved')
+parser.add_argument('--parallel', type=int, default=2,
+                    help='Number of trials to run at the same time')
+parser.add_argument('--threads_per_trial', type=int, default=1,
+                    help='Number of cpu threads each trial may use')
+parser.add_argument('--epochs', type=int, default=30,
+                    help='Maximum number of training epochs per trial')
+parser.add_argument('--min_epochs', type=int, default=3,
+                    help='Epochs every trial runs before it can be stopped early')
+parser.add_argument('--reduction_factor', type=int, default=3,
+                    help='Only the best 1/reduction_factor of trials continue past '
+                         'each rung of successive halving. 1 disables early stopping')
+parser.add_argument('--cache_dir', type=str, default=None,
+                    help='Directory of the split cache shared with run_training.py '
+                         '--cache_dir. Defaults to a cache inside the sweep directory')
+parser.add_argument('--cache_max_gb', type=float, default=20,
+                    help='Size of the split cache above which the least recently '
+                         'used splits are removed')
+parser.add_argument('--seed', type=int, default=22012018,
+                    help='Seed for sampling random search parameters')
+args = parser.parse_args()
+
+with open(args.spec) as f:
+    spec = json.load(f)
+reserved = sorted(set(SWEEP_OPTIONS) & (set(spec.get('fixed', {})) | set(spec.get('grid', {})) |
+                                        set(spec.get('random', {}))))
+if reserved:
+    parser.error('{} cannot be in --spec, the sweep sets them for every trial (the number '
+                 'of epochs is --epochs)'.format(', '.join(reserved)))
+
+SWEEP_DIR = os.path.join(args.model_dir, args.name)
+TRIALS_DIR = os.path.join(SWEEP_DIR, 'trials')
+os.makedirs(TRIALS_DIR)
+
+VALID_AUC_LINE = re.compile(r'Epoch (\d+),.*AUC: ([\d.]+) \(valid\)')
+
+
+def sample_value(distribution, rng):
+    (kind, values), = distribution.items()
+    if kind == 'choice':
+        return values[rng.randint(len(values))]
+    if kind == 'uniform':
+        return float(rng.uniform(*values))
+    if kind == 'loguniform':
+        return float(np.exp(rng.uniform(np.log(values[0]), np.log(values[1]))))
+    if kind == 'randint':
+        return int(rng.randint(values[0], values[1] + 1))
+    raise ValueError('Unknown distribution {}'.format(kind))
+
+
+def make_trials(spec, rng):
+    """Return a list of parameter dictionaries, one per trial."""
+    grid = spec.get('grid', {})
+    names = sorted(grid)
+    trials = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        for _ in range(spec.get('num_trials', 1) if 'random' in spec else 1):
+            params = dict(spec.get('fixed', {}))
+            params.update(zip(names, values))
+            for name, distribution in sorted(spec.get('random', {}).items()):
+                params[name] = sample_value(distribution, rng)
+            trials.append(params)
+    return trials
+
+
+def prepare_split(params, cache):
+    """Load and split the data for params unless it is cached already, so
+    that all trials with the same data parameters memory-map a single copy.
+    The entry is pinned until the sweep ends, so neither the splits of later
+    trials nor other runs sharing the cache evict it. Returns the cache
+    entry directory to pass as --split_dir."""
+    key = cache.split_key(
+        args.data_dir, 'train', args.which_year, fraction=params.get('fraction', 1.0),
+        max_time_steps=params.get('max_time_steps'),
+        plus_minus_feats=params.get('plus_minus_feats', False),
+        compressed_sensing=params.get('compressed_sensing', False),
+        projection=params.get('projection', 'sparse'),
+        projection_dim=params.get('projection_dim', 100),
+        projection_seed=params.get('projection_seed', DEFAULT_SEED))
+    cache.pin(key)
+    split_dir = cache.get(key)
+    if split_dir is None:
+        data_provider = ASSISTDataProvider(
+            args.data_dir,
+            which_set='train',
+            which_year=args.which_year,
+            use_plus_minus_feats=params.get('plus_minus_feats', False),
+            use_compressed_sensing=params.get('compressed_sensing', False),
+            projection=params.get('projection', 'sparse'),
+            projection_dim=params.get('projection_dim', 100),
+            projection_seed=params.get('projection_seed', DEFAULT_SEED),
+            fraction=params.get('fraction', 1.0))
+        train_set, val_set = data_provider.train_validation_split(
+            params.get('max_time_steps'))
+        split_dir = cache.put(key, {'train': train_set.get_data(),
+                                    'valid': val_set.get_data()})
+    return split_dir
+
+
+class SuccessiveHalving(object):
+    """Asynchronous successive halving.
+
+    Rungs are placed at min_epochs * reduction_factor**k epochs. When a trial
+    reaches a rung its validation AUC is compared with those of the trials
+    that reached the rung before it, and it is stopped unless it is in the
+    top 1/reduction_factor of them."""
+
+    def __init__(self, min_epochs, max_epochs, reduction_factor):
+        self.rungs = {}
+        self.reduction_factor = reduction_factor
+        if reduction_factor > 1:
+            epochs = min_epochs
+            while epochs < max_epochs:
+                self.rungs[epochs] = []
+                epochs *= reduction_factor
+        self.lock = threading.Lock()
+
+    def should_stop(self, epochs_completed, auc):
+        if epochs_completed not in self.rungs:
+            return False
+        with self.lock:
+            seen = self.rungs[epochs_completed]
+            seen.append(auc)
+            if len(seen) < self.reduction_factor:
+                return False
+            cutoff = np.percentile(seen, 100 * (1 - 1. / self.reduction_factor))
+            return auc < cutoff
+
+
+def run_trial(trial_id, params, split_dir, slots, halving):
+    name = 'trial_{:03d}'.format(trial_id)
+    options = dict(params)
+    options.update({
+        'data_dir': args.data_dir,
+        'which_set': 'train',
+        'which_year': args.which_year,
+        'model_dir': TRIALS_DIR,
+        'name': name,
+        'epochs': args.epochs,
+        'split_dir': split_dir})
+    options.update(thread_options(args.threads_per_trial))
+
+    cpus = slots.get()
+    options['cpus'] = cpus_option(cpus)
+    start = time()
+    status = 'completed'
+    try:
+        with open(os.path.join(TRIALS_DIR, name + '.log'), 'w') as log:
+            process = subprocess.Popen(script_command('run_training.py', options),
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       universal_newlines=True,
+                                       env=thread_capped_env(args.threads_per_trial))
+            for line in process.stdout:
+                log.write(line)
+                match = VALID_AUC_LINE.search(line)
+                if match and halving.should_stop(int(match.group(1)) + 1,
+                                                 float(match.group(2))):
+                    status = 'stopped'
+                    process.terminate()
+                    break
+            process.stdout.close()
+            if process.wait() != 0 and status != 'stopped':
+                status = 'failed'
+    finally:
+        slots.put(cpus)
+
+    row = {'trial': name, 'status': status, 'elapsed_sec': round(time() - start, 1)}
+    results_file = os.path.join(TRIALS_DIR, name, 'results.json')
+    if os.path.isfile(results_file):
+        with open(results_file) as f:
+            row.update(json.load(f))
+    row.update(params)
+    print('{} {} (best valid AUC: {})'.format(name, status, row.get('best_valid_auc')))
+    return row
+
+
+trials = make_trials(spec, np.random.RandomState(args.seed))
+with open(os.path.join(SWEEP_DIR, 'trials.json'), 'w') as f:
+    json.dump(trials, f, indent=2, sort_keys=True)
+print('Sweep of {} trials started at {}'.format(len(trials), START_TIME))
+
+cache = DatasetCache(args.cache_dir or os.path.join(SWEEP_DIR, 'cache'),
+                     max_bytes=int(args.cache_max_gb * 2**30))
+trial_split_dirs = [prepare_split(params, cache) for params in trials]
+cache_bytes = cache.evict()
+if cache_bytes > cache.max_bytes:
+    print('The splits of the sweep take {:.1f} GB, more than --cache_max_gb. They are '
+          'kept until the next sweep evicts them'.format(cache_bytes / 2**30))
+
+slots = queue.Queue()
+for cpus in cpu_slots(args.parallel, args.threads_per_trial):
+    slots.put(cpus)
+halving = SuccessiveHalving(args.min_epochs, args.epochs, args.reduction_factor)
+
+try:
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        rows = list(executor.map(
+            lambda i: run_trial(i, trials[i], trial_split_dirs[i], slots, halving),
+            range(len(trials))))
+finally:
+    cache.unpin_all()
+
+rows.sort(key=lambda row: -1 if row.get('best_valid_auc') is None
+          else row['best_valid_auc'], reverse=True)
+columns = ['trial', 'status', 'best_valid_auc', 'best_epoch', 'epochs_completed',
+           'last_valid_auc', 'last_valid_loss', 'elapsed_sec']
+columns += sorted(set(key for row in rows for key in row) - set(columns))
+with open(os.path.join(SWEEP_DIR, 'results.csv'), 'w') as f:
+    writer = csv.DictWriter(f, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+print('Results saved at', os.path.join(SWEEP_DIR, 'results.csv'))
@@ -1,12 +1,14 @@
-from data_provider import ASSISTDataProvider
-from LstmModel import LstmModel
-from utils import get_learning_rate, log_learning_rate_and_grad_norms, plot_learning_curves
+# Only light modules are imported before the arguments are parsed and
+# checked, so that --help and argument errors are fast. numpy, scipy and
+# TensorFlow are imported further down, once they are needed.
+from perf_config import add_perf_config_arguments, get_perf_config, pin_cpus
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from time import gmtime, strftime
+from time import gmtime, strftime, time
 
+import json
 import os
-import tensorflow as tf
+import sys
 
 START_TIME = strftime('%Y%m%d-%H%M', gmtime())
 
@@ -26,13 +28,80 @@ parser.add_argument('--name', type=str, default=START_TIME,
                     help='Name of experiment when saving model')
 parser.add_argument('--model_dir', type=str, default='.',
                     help='Path to directory where model will be saved')
+parser.add_argument('--split_dir', type=str, default=None,
+                    help='Directory containing a train/valid split saved with '
+                         'save_provider_data (e.g. by run_sweep.py). If given, '
+                         'the split is memory-mapped instead of recomputed')
+parser.add_argument('--shared_data_dir', type=str, default=None,
+                    help='Directory containing the full data set saved with '
+                         'save_provider_data. If given, it is memory-mapped and '
+                         'split instead of loading the data from data_dir')
+parser.add_argument('--cv_folds', type=int, default=0,
+                    help='If > 1, train every fold of k-fold cross-validation '
+                         'concurrently in separate processes')
+parser.add_argument('--fold', type=int, default=None,
+                    help='Train only this fold of --cv_folds cross-validation')
+parser.add_argument('--cache_dir', type=str, default=None,
+                    help='Directory of a cache of train/valid splits shared by '
+                         'runs. If given, the split is memory-mapped from the '
+                         'cache when the data and parameters are unchanged, '
+                         'and added to it otherwise')
+parser.add_argument('--cache_max_gb', type=float, default=20,
+                    help='Size of --cache_dir above which the least recently '
+                         'used splits are removed')
+
+# Arguments for choosing the batch size and sequence length under a memory budget
+parser.add_argument('--memory_budget_gb', type=float, default=None,
+                    help='If given, choose --batch and --max_time_steps out of '
+                         '--plan_batches and --plan_time_steps: the fastest '
+                         'combination whose estimated and probed memory fits '
+                         'this many GB per training process (see memory_planner.py)')
+parser.add_argument('--plan_batches', type=str, default='16,32,64,128',
+                    help='Comma-separated batch sizes --memory_budget_gb chooses from')
+parser.add_argument('--plan_time_steps', type=str, default='50,100,200',
+                    help='Comma-separated max_time_steps --memory_budget_gb chooses from')
+
+# Arguments controlling threading and graph optimisation
+add_perf_config_arguments(parser)
+
+# Arguments for synchronous data-parallel training
+parser.add_argument('--num_workers', type=int, default=1,
+                    help='If > 1, start a parameter server and this many '
+                         'workers on localhost and train data-parallel')
+parser.add_argument('--ps_hosts', type=str, default=None,
+                    help='Comma-separated host:port list of parameter servers')
+parser.add_argument('--worker_hosts', type=str, default=None,
+                    help='Comma-separated host:port list of workers')
+parser.add_argument('--job_name', type=str, default=None,
+                    help='Either ps or worker. Set to train as one task of '
+                         'the cluster given by --ps_hosts and --worker_hosts')
+parser.add_argument('--task_index', type=int, default=0,
+                    help='Index of this task within its job')
+
+# Arguments for validation
+parser.add_argument('--background_validation', dest='background_validation',
+                    action='store_true',
+                    help='evaluate the checkpoint of each epoch in a separate '
+                         'process (validation_worker.py), so training does not '
+                         'wait for validation')
+parser.add_argument('--no-background_validation', dest='background_validation',
+                    action='store_false',
+                    help='evaluate on the validation set after each epoch')
+parser.set_defaults(background_validation=False)
+parser.add_argument('--validation_threads', type=int, default=1,
+                    help='Threads of the background validation process')
 
 # Arguments for debugging
 parser.add_argument('--log_stats', dest='log_stats', action='store_true',
-                    help='print learning rate and gradient norms once every 10 epochs')
+                    help='log learning rate, gradient and weight norms every '
+                         'log_stats_every training steps')
 parser.add_argument('--no-log_stats', dest='log_stats', action='store_false',
-                    help='do not print learning rate and gradient norms once every 10 epochs')
+                    help='do not log learning rate, gradient and weight norms')
 parser.set_defaults(log_stats=False)
+parser.add_argument('--log_stats_every', type=int, default=100,
+                    help='Number of training steps between logging norms')
+parser.add_argument('--trace_steps', type=int, default=0,
+                    help='Save a full tf.RunMetadata trace of the first x training steps')
 parser.add_argument('--fraction', type=float, default=1.0,
                     help='Fraction of data to use. Useful for hyperparameter tuning')
 
@@ -47,11 +116,26 @@ parser.add_argument('--compressed_sensing', dest='compressed_sensing', action='s
 parser.add_argument('--no-compressed_sensing', dest='compressed_sensing', action='store_false',
                     help='do not use use compressed sensing')
 parser.set_defaults(compressed_sensing=False)
+parser.add_argument('--projection', type=str, default='sparse',
+                    choices=['sparse', 'hashed'],
+                    help='Random projection used by compressed sensing: very '
+                         'sparse random projection or feature hashing')
+parser.add_argument('--projection_dim', type=int, default=100,
+                    help='Dimension inputs are projected to by compressed sensing')
+parser.add_argument('--projection_seed', type=int, default=22012018,
+                    help='Seed the compressed sensing projection is generated from')
 parser.add_argument('--max_time_steps', type=int, default=None,
                     help='limit length of students sequences of answers')
+parser.add_argument('--pack_sequences', dest='pack_sequences', action='store_true',
+                    help='pack several students into each row of max_time_steps '
+                         'steps, resetting the LSTM state between them')
+parser.add_argument('--no-pack_sequences', dest='pack_sequences', action='store_false',
+                    help='feed one student per row')
+parser.set_defaults(pack_sequences=False)
 
 # Arguments to control model hyperparameters
 parser.add_argument('--optimisation', type=str, default='sgd',
+                    choices=['adam', 'rmsprop', 'momentum', 'sgd'],
                     help='optimisation method. Choices are: adam, rmsprop, '
                          'momentum and sgd.')
 parser.add_argument('--init_learn_rate', type=float, default=10,
@@ -70,6 +154,10 @@ parser.add_argument('--epochs', type=int, default=100,
                     help='Number of training epochs')
 parser.add_argument('--clip_norm', type=float, default=1,
                     help='clip norms of gradients')
+parser.add_argument('--accum_steps', type=int, default=1,
+                    help='Accumulate the gradients of this many batches and '
+                         'apply their mean once, for an effective batch size of '
+                         'accum_steps * batch without the memory of a large batch')
 parser.add_argument('--keep_prob', type=float, default=0.6,
                     help='Fraction to keep in dropout applied to LSTM cell')
 parser.add_argument('--var_dropout', dest='var_dropout', action='store_true',
@@ -77,105 +165,434 @@ parser.add_argument('--var_dropout', dest='var_dropout', action='store_true',
 parser.add_argument('--no-var_dropout', dest='var_dropout', action='store_false',
                     help='do not use variational dropout')
 parser.set_defaults(var_dropout=True)
+
+# Arguments for loss-aware importance sampling of the students
+parser.add_argument('--importance_sampling', dest='importance_sampling', action='store_true',
+                    help='draw the students of each epoch with probabilities that '
+                         'grow with their recent training loss, weighting their '
+                         'loss to keep the gradients unbiased (see sampler.py). '
+                         'The training loss, accuracy and AUC of each epoch are '
+                         'then those of the sampled students, unweighted, so they '
+                         'are not comparable with runs without it. Cannot be '
+                         'combined with --pack_sequences')
+parser.add_argument('--no-importance_sampling', dest='importance_sampling',
+                    action='store_false',
+                    help='visit every student once per epoch, in shuffled order')
+parser.set_defaults(importance_sampling=False)
+parser.add_argument('--sampling_uniform', type=float, default=0.5,
+                    help='Fraction of the sampling probability spread uniformly '
+                         'over all students. Bounds the loss weights by its inverse')
+parser.add_argument('--sampling_decay', type=float, default=0.9,
+                    help='Decay of the moving average of the loss of each student')
+parser.add_argument('--sub_epoch_size', type=int, default=0,
+                    help='With importance sampling, number of students drawn per '
+                         'epoch. 0 draws as many as there are students')
 args = parser.parse_args()
 
+# Check the arguments and data paths before doing anything expensive
+if args.job_name not in [None, 'ps', 'worker']:
+    parser.error('--job_name must be either ps or worker')
+if args.job_name and not (args.ps_hosts and args.worker_hosts):
+    parser.error('--job_name requires --ps_hosts and --worker_hosts')
+if args.accum_steps < 1:
+    parser.error('--accum_steps must be at least 1')
+if args.accum_steps > 1 and (args.num_workers > 1 or args.job_name):
+    parser.error('--accum_steps cannot be combined with distributed training')
+if args.importance_sampling and not 0 < args.sampling_uniform <= 1:
+    parser.error('--sampling_uniform must be in (0, 1]')
+if args.importance_sampling and not 0 <= args.sampling_decay < 1:
+    parser.error('--sampling_decay must be in [0, 1)')
+if args.importance_sampling and args.pack_sequences:
+    # the sampler would track and weight packed rows instead of students
+    parser.error('--importance_sampling cannot be combined with --pack_sequences')
+if args.sub_epoch_size < 0:
+    parser.error('--sub_epoch_size must be at least 0')
+# the split uses the first of 5 folds unless cross-validating
+num_folds = args.cv_folds if args.cv_folds > 1 else 5
+fold = args.fold or 0
+if args.fold is not None and not 0 <= args.fold < num_folds:
+    parser.error('--fold must be in [0, --cv_folds)')
 SAVE_DIR = os.path.join(args.model_dir, args.name)
+if os.path.exists(SAVE_DIR):
+    parser.error('{} already exists, choose another --name'.format(SAVE_DIR))
+for data_dir in [args.split_dir, args.shared_data_dir]:
+    if data_dir and not os.path.isdir(data_dir):
+        parser.error('{} is not a directory'.format(data_dir))
+if args.job_name != 'ps' and not (args.split_dir or args.shared_data_dir):
+    data_path = os.path.join(os.path.expanduser(args.data_dir),
+                             'assist{0}-{1}'.format(args.which_year, args.which_set))
+    for suffix in ['-inputs-plus-minus.npz' if args.plus_minus_feats else '-inputs.npz',
+                   '-targetids.npz', '-targets.npz']:
+        if not os.path.isfile(data_path + suffix):
+            parser.error('Data file does not exist: ' + data_path + suffix)
+if args.memory_budget_gb and args.job_name:
+    # every task would plan on its own and might choose different values
+    parser.error('--memory_budget_gb cannot be used with --job_name. Plan on one '
+                 'machine and pass the chosen --batch and --max_time_steps to all tasks')
+if args.memory_budget_gb and (args.split_dir or args.shared_data_dir):
+    parser.error('--memory_budget_gb cannot change max_time_steps of a saved split')
+try:
+    perf_settings = get_perf_config(args)
+except (IOError, ValueError) as e:
+    parser.error(str(e))
+
 os.mkdir(SAVE_DIR)
+with open(os.path.join(SAVE_DIR, 'args.json'), 'w') as f:
+    json.dump(vars(args), f, indent=2, sort_keys=True)
+pin_cpus(perf_settings)
+
+if args.memory_budget_gb and args.job_name != 'ps':
+    from memory_planner import data_shape, plan, save_plan
+    shape = data_shape(args.data_dir, args.which_set, args.which_year, args.fraction,
+                       args.plus_minus_feats, args.compressed_sensing,
+                       args.projection_dim, args.pack_sequences)
+    run_plan = plan(shape, int(args.memory_budget_gb * 2**30),
+                    [int(x) for x in args.plan_batches.split(',')],
+                    [int(x) for x in args.plan_time_steps.split(',')],
+                    args.num_hidden_units, args.optimisation)
+    save_plan(SAVE_DIR, run_plan)
+    print('Memory plan: batch {}, max_time_steps {}{}'.format(
+        run_plan['batch'], run_plan['max_time_steps'],
+        '' if run_plan['fits'] else ' (no candidate fits the budget)'))
+    # folds and workers started from here train with the planned values
+    args.batch, args.max_time_steps = run_plan['batch'], run_plan['max_time_steps']
+    args.memory_budget_gb = None
+    with open(os.path.join(SAVE_DIR, 'args.json'), 'w') as f:
+        json.dump(vars(args), f, indent=2, sort_keys=True)
+
+if args.cv_folds > 1 and args.fold is None:
+    from cross_validation import run_cross_validation
+    run_cross_validation(args, SAVE_DIR)
+    sys.exit()
+
+if args.num_workers > 1 and args.job_name is None:
+    from distributed import run_local_cluster
+    run_local_cluster(args, SAVE_DIR)
+    sys.exit()
+
+from data_provider import ASSISTDataProvider, load_provider_data
+from distributed import create_distributed_session, start_server
+from LstmModel import LstmModel
+from metrics_log import MetricsLog
+from perf_config import apply_perf_config, save_perf_config
+from profiling import StepTimer, save_timings, save_trace, summary_proto
+from utils import get_learning_rate, plot_learning_curves
+from validation_worker import best_checkpoint_path, start_validation_worker, \
+    stop_validation_worker
+
+import tensorflow as tf
+
+config = apply_perf_config(perf_settings)
+save_perf_config(SAVE_DIR, perf_settings, config)
+
+server = None
+is_chief = True
+if args.job_name:
+    cluster, server = start_server(args, config)
+    if args.job_name == 'ps':
+        server.join()
+    num_workers = cluster.num_tasks('worker')
+    is_chief = args.task_index == 0
+
+split_dir = args.split_dir
+cache = None
+if args.cache_dir and not (split_dir or args.shared_data_dir):
+    from dataset_cache import DatasetCache
+    cache = DatasetCache(args.cache_dir, max_bytes=int(args.cache_max_gb * 2**30))
+    cache_key = cache.split_key(
+        args.data_dir, args.which_set, args.which_year, fraction=args.fraction,
+        max_time_steps=args.max_time_steps, plus_minus_feats=args.plus_minus_feats,
+        compressed_sensing=args.compressed_sensing, projection=args.projection,
+        projection_dim=args.projection_dim, projection_seed=args.projection_seed,
+        num_folds=num_folds, fold=fold)
+    split_dir = cache.get(cache_key)
+    if split_dir:
+        print('Using cached split', split_dir)
+
+if split_dir:
+    train_set, val_set = [
+        ASSISTDataProvider(
+            args.data_dir,
+            which_set=args.which_set,
+            which_year=args.which_year,
+            batch_size=args.batch,
+            use_plus_minus_feats=args.plus_minus_feats,
+            use_compressed_sensing=args.compressed_sensing,
+            projection=args.projection,
+            projection_dim=args.projection_dim,
+            projection_seed=args.projection_seed,
+            fraction=args.fraction,
+            data=load_provider_data(os.path.join(split_dir, split)))
+        for split in ['train', 'valid']]
+else:
+    data_provider = ASSISTDataProvider(
+        args.data_dir,
+        which_set=args.which_set,
+        which_year=args.which_year,
+        batch_size=args.batch,
+        use_plus_minus_feats=args.plus_minus_feats,
+        use_compressed_sensing=args.compressed_sensing,
+        projection=args.projection,
+        projection_dim=args.projection_dim,
+        projection_seed=args.projection_seed,
+        fraction=args.fraction,
+        data=load_provider_data(args.shared_data_dir) if args.shared_data_dir else None)
+    train_set, val_set = data_provider.train_validation_split(
+        args.max_time_steps, num_folds=num_folds, fold=fold)
+    if cache is not None:
+        cache.put(cache_key, {'train': train_set.get_data(), 'valid': val_set.get_data()})
 
-data_provider = ASSISTDataProvider(
-    args.data_dir,
-    which_set=args.which_set,
-    which_year=args.which_year,
-    batch_size=args.batch,
-    use_plus_minus_feats=args.plus_minus_feats,
-    use_compressed_sensing=args.compressed_sensing,
-    fraction=args.fraction)
-train_set, val_set = data_provider.train_validation_split(args.max_time_steps)
+if args.pack_sequences:
+    train_set, val_set = train_set.pack(), val_set.pack()
+
+if server is not None:
+    # every worker trains on its own part of the students
+    train_set = train_set.shard(num_workers, args.task_index)
+
+sampler = None
+if args.importance_sampling:
+    from sampler import LossSampler, answer_weights
+    sampler = LossSampler(train_set.inputs.shape[0], uniform=args.sampling_uniform,
+                          decay=args.sampling_decay, rng=train_set.rng)
+    train_set.attach_sampler(sampler, epoch_size=args.sub_epoch_size or None)
 
 model = LstmModel(max_time_steps=train_set.max_num_ans,
                   feature_len=train_set.encoding_dim,
                   n_distinct_questions=train_set.max_prob_set_id,
                   var_dropout=args.var_dropout,
-                  batch_size=args.batch)
+                  batch_size=args.batch,
+                  input_dtype=train_set.inputs.dtype,
+                  reset_channel=args.pack_sequences)
 
 print('Experiment started at', START_TIME)
 
-model.build_graph(n_hidden_units=args.num_hidden_units,
-                  clip_norm=args.clip_norm,
-                  optimisation=args.optimisation)
+if server is None:
+    model.build_graph(n_hidden_units=args.num_hidden_units,
+                      clip_norm=args.clip_norm,
+                      optimisation=args.optimisation,
+                      accum_steps=args.accum_steps)
+else:
+    worker_device = '/job:worker/task:{}'.format(args.task_index)
+    with tf.device(tf.train.replica_device_setter(worker_device=worker_device,
+                                                  cluster=cluster)):
+        model.build_graph(n_hidden_units=args.num_hidden_units,
+                          clip_norm=args.clip_norm,
+                          optimisation=args.optimisation,
+                          num_replicas=num_workers,
+                          metrics_device=worker_device)
+
+# with background validation, training keeps the checkpoints of all epochs
+# (and lists them in the checkpoint state, where the worker finds them) and
+# the worker removes the old ones once it has evaluated them
+train_saver = tf.train.Saver(max_to_keep=args.epochs if args.background_validation else 5)
+# keeps the checkpoint with the best validation AUC
+valid_saver = tf.train.Saver(max_to_keep=1)
+
+merged_loss = tf.summary.merge(model.summary_loss)
+merged_aucacc = tf.summary.merge(model.summary_aucacc)
+merged_norms = tf.summary.merge(model.summary_norms)
+init_op = tf.global_variables_initializer()
+results = {'best_valid_auc': None, 'best_epoch': None, 'best_checkpoint': None}
+
+validation_worker = None
+if is_chief and args.background_validation:
+    validation_worker = start_validation_worker(SAVE_DIR, val_set, args.validation_threads)
 
-train_saver = tf.train.Saver()
-valid_saver = tf.train.Saver()
+if server is None:
+    session = tf.Session(config=config)
+else:
+    session, supervisor = create_distributed_session(
+        server, model, is_chief, config, init_op, restore_path=args.restore)
 
-with tf.Session() as sess:
-    merged_loss = tf.summary.merge(model.summary_loss)
-    merged_aucacc = tf.summary.merge(model.summary_aucacc)
+with session as sess:
     train_writer = tf.summary.FileWriter(SAVE_DIR + '/train', graph=sess.graph)
     valid_writer = tf.summary.FileWriter(SAVE_DIR + '/valid', graph=sess.graph)
-    sess.run(tf.global_variables_initializer())
 
-    if args.restore:
-        train_saver.restore(sess, tf.train.latest_checkpoint(args.restore))
-        print("Model restored!")
+    if server is None:
+        sess.run(init_op)
+        if args.accum_steps > 1:
+            sess.run(model.accum_init)
+        if args.restore:
+            train_saver.restore(sess, tf.train.latest_checkpoint(args.restore))
+            print("Model restored!")
+
+    metrics_log = MetricsLog(SAVE_DIR)
+    start_time = time()
+    timer = StepTimer()
+    timings = []
+    num_traced_steps = 0
+    train_step = 0
+    if args.trace_steps:
+        os.mkdir(os.path.join(SAVE_DIR, 'traces'))
 
     print("Starting training...")
     for epoch in range(args.epochs):
+        timer.reset()
         model.reuse = False
         sess.run(model.auc_init)
         sess.run(model.acc_init)
+        sess.run(model.loss_init)
         learning_rate = get_learning_rate(epoch, args.init_learn_rate, args.min_learn_rate,
                                           args.lr_exp_decay, args.lr_decay_step)
 
-        for i, (inputs, targets, target_ids) in enumerate(train_set):
-            _, loss, acc_update, auc_update, summary_loss = sess.run(
-                [model.training, model.loss, model.accuracy[1], model.auc[1],
-                 merged_loss],
-                feed_dict={model.inputs: inputs,
-                           model.targets: targets,
-                           model.target_ids: target_ids,
-                           model.learning_rate: learning_rate,
-                           model.keep_prob: float(args.keep_prob)})
+        # number of batches (and their answers) whose gradients are
+        # accumulated but not applied yet
+        num_accumulated, num_accumulated_answers = 0, 0
+        for i, (inputs, targets, target_ids) in enumerate(timer.timed_iter(train_set)):
+            with timer.phase('feed'):
+                # the batches already have the dtypes of the placeholders (the
+                # inputs are cast to float32 in the graph), so feeding them
+                # does not convert or copy them
+                feed_dict = {model.inputs: inputs,
+                             model.targets: targets,
+                             model.target_ids: target_ids,
+                             model.learning_rate: learning_rate,
+                             model.keep_prob: float(args.keep_prob)}
+                if sampler is not None:
+                    feed_dict[model.example_weights] = answer_weights(
+                        train_set.batch_weights, train_set.batch_lengths)
+
+            run_options, run_metadata = None, None
+            if num_traced_steps < args.trace_steps:
+                run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+                run_metadata = tf.RunMetadata()
+
+            # the norms are fetched in the same run as the training op
+            fetches = [model.training if args.accum_steps == 1 else model.accumulate,
+                       model.mean_loss[1], model.accuracy[1], model.auc[1], merged_loss]
+            log_norms = args.log_stats and train_step % args.log_stats_every == 0
+            if log_norms:
+                fetches.extend([merged_norms, model.global_grad_norm])
+            if sampler is not None:
+                fetches.append(model.loss_per_example)
+
+            with timer.phase('compute'):
+                step_results = sess.run(fetches,
+                                        feed_dict=feed_dict,
+                                        options=run_options,
+                                        run_metadata=run_metadata)
+            _, loss, acc_update, auc_update, summary_loss = step_results[:5]
+            timer.count_step(len(inputs), len(targets))
 
-            if args.log_stats and epoch % 10 == 0 and i == 0:
-                log_learning_rate_and_grad_norms(sess, model, inputs, targets,
-                                                 target_ids, learning_rate, args.keep_prob)
+            if log_norms:
+                summary_norms, global_grad_norm = step_results[5:7]
+                train_writer.add_summary(summary_norms, train_step)
+                print("Step {},  learning rate: {},  global grad norm: {:.4f}"
+                      .format(train_step, learning_rate, global_grad_norm))
+            train_step += 1
 
-        accuracy, auc, summary_aucacc = sess.run(
-            [model.accuracy[0], model.auc[0], merged_aucacc])
+            if sampler is not None:
+                with timer.phase('sampler'):
+                    sampler.update(train_set.batch_indices, train_set.batch_lengths,
+                                   step_results[-1])
 
-        print("Epoch {},  Loss: {:.3f},  Accuracy: {:.3f},  AUC: {:.3f} (train)"
-              .format(epoch, loss, accuracy, auc))
+            if run_metadata is not None:
+                train_writer.add_run_metadata(run_metadata, 'step{}'.format(num_traced_steps))
+                save_trace(run_metadata, os.path.join(
+                    SAVE_DIR, 'traces', 'timeline_step{}.json'.format(num_traced_steps)))
+                num_traced_steps += 1
+
+            if args.accum_steps > 1:
+                num_accumulated += 1
+                num_accumulated_answers += len(targets)
+                if num_accumulated == args.accum_steps:
+                    with timer.phase('compute'):
+                        sess.run(model.training,
+                                 feed_dict={model.learning_rate: learning_rate,
+                                            model.accum_answers: max(num_accumulated_answers, 1)})
+                    num_accumulated, num_accumulated_answers = 0, 0
+
+        if num_accumulated:
+            # apply the gradients of the last batches of the epoch
+            with timer.phase('compute'):
+                sess.run(model.training,
+                         feed_dict={model.learning_rate: learning_rate,
+                                    model.accum_answers: max(num_accumulated_answers, 1)})
+
+        loss, accuracy, auc, summary_aucacc = sess.run(
+            [model.mean_loss[0], model.accuracy[0], model.auc[0], merged_aucacc])
+
+        # with importance sampling, the metrics are those of the sampled
+        # students, which are not weighted
+        print("Epoch {},  Loss: {:.3f},  Accuracy: {:.3f},  AUC: {:.3f} (train{})"
+              .format(epoch, loss, accuracy, auc,
+                      ', importance-sampled' if sampler is not None else ''))
+        metrics_log.append(epoch, 'train', loss, accuracy, auc,
+                           learning_rate=learning_rate, wall_time=time() - start_time)
 
         # save metrics and model each epoch
         train_writer.add_summary(summary_loss, epoch)
         train_writer.add_summary(summary_aucacc, epoch)
-        save_file = "{}/{}_{}.ckpt".format(SAVE_DIR, args.name, epoch)
-        train_saver.save(sess, save_file)
+        # only the chief saves and evaluates the model
+        if is_chief:
+            with timer.phase('save'):
+                save_file = "{}/{}_{}.ckpt".format(SAVE_DIR, args.name, epoch)
+                train_saver.save(sess, save_file)
 
-        # Evaluate on validation set
-        model.reuse = True
-        sess.run(model.auc_init)
-        sess.run(model.acc_init)
+        # with background validation, the validation worker evaluates the
+        # checkpoint while training continues
+        if is_chief and validation_worker is None:
+            # Evaluate on validation set
+            with timer.phase('validation'):
+                model.reuse = True
+                sess.run(model.auc_init)
+                sess.run(model.acc_init)
+                sess.run(model.loss_init)
+
+                for i, (inputs, targets, target_ids) in enumerate(val_set):
+                    _, acc_update, auc_update, summary_loss = sess.run(
+                        [model.mean_loss[1], model.accuracy[1], model.auc[1], merged_loss],
+                        feed_dict={
+                            model.inputs: inputs,
+                            model.targets: targets,
+                            model.target_ids: target_ids})
 
-        for i, (inputs, targets, target_ids) in enumerate(val_set):
-            loss, acc_update, auc_update, summary_loss = sess.run(
-                [model.loss, model.accuracy[1], model.auc[1], merged_loss],
-                feed_dict={
-                    model.inputs: inputs,
-                    model.targets: targets,
-                    model.target_ids: target_ids})
+                loss, accuracy, auc, summary_aucacc = sess.run(
+                    [model.mean_loss[0], model.accuracy[0], model.auc[0], merged_aucacc])
+            print("Epoch {},  Loss: {:.3f},  Accuracy: {:.3f},  AUC: {:.3f} (valid)"
+                  .format(epoch, loss, accuracy, auc))
+            metrics_log.append(epoch, 'valid', loss, accuracy, auc,
+                               wall_time=time() - start_time)
 
-        accuracy, auc, summary_aucacc = sess.run(
-            [model.accuracy[0], model.auc[0], merged_aucacc])
-        print("Epoch {},  Loss: {:.3f},  Accuracy: {:.3f},  AUC: {:.3f} (valid)"
-              .format(epoch, loss, accuracy, auc))
+            valid_writer.add_summary(summary_loss, epoch)
+            valid_writer.add_summary(summary_aucacc, epoch)
 
-        valid_writer.add_summary(summary_loss, epoch)
-        valid_writer.add_summary(summary_aucacc, epoch)
+            # keep a small summary of the run up to date, so that runs which get
+            # interrupted (or stopped early by run_sweep.py) still report results
+            if results['best_valid_auc'] is None or auc > results['best_valid_auc']:
+                results['best_valid_auc'] = float(auc)
+                results['best_epoch'] = epoch
+                results['best_checkpoint'] = valid_saver.save(
+                    sess, best_checkpoint_path(SAVE_DIR, args.name))
+            results['epochs_completed'] = epoch + 1
+            results['last_valid_auc'] = float(auc)
+            results['last_valid_loss'] = float(loss)
+            with open(os.path.join(SAVE_DIR, 'results.json'), 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        # timings of the hot path of this epoch
+        epoch_timing = timer.summary()
+        if sampler is not None:
+            epoch_timing.update(sampler.summary())
+        train_writer.add_summary(summary_proto(epoch_timing), epoch)
+        timings.append(dict(epoch_timing, epoch=epoch))
+        save_timings(SAVE_DIR, timings)
+        print("Epoch {},  {:.0f} answers/sec,  data: {:.1f}s,  feed: {:.1f}s,  "
+              "compute: {:.1f}s,  peak RSS: {:.0f} MB"
+              .format(epoch, epoch_timing.get('answers_per_sec', 0),
+                      epoch_timing.get('data_sec', 0), epoch_timing.get('feed_sec', 0),
+                      epoch_timing.get('compute_sec', 0), epoch_timing['peak_rss_mb']))
 
     train_writer.close()
     valid_writer.close()
+    if server is not None:
+        supervisor.stop()
+
+    if is_chief:
+        print("Saved model at", save_file)  # training finished
 
-    print("Saved model at", save_file)  # training finished
+if validation_worker is not None:
+    stop_validation_worker(SAVE_DIR, validation_worker)
 
-plot_learning_curves(SAVE_DIR, args.epochs)
+if is_chief:
+    plot_learning_curves(SAVE_DIR, args.epochs)
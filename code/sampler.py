@@ -0,0 +1,100 @@
+"""Loss-aware importance sampling of the students of a data provider.
+
+Shuffling visits every student once per epoch, even once most of them are
+predicted well. LossSampler instead keeps an exponential moving average of
+the recent training loss of every student (a float32 array, 4 bytes per
+student) and draws the students of each epoch with probability
+
+    p_i = uniform / N + (1 - uniform) * loss_i / sum(loss)
+
+with replacement, so students which are predicted badly are visited more
+often. To keep the gradients unbiased, the loss of every answer of student i
+is weighted by 1 / (N * p_i) (see LstmModel's example_weights). The uniform
+part bounds these weights by 1 / uniform and keeps every student reachable.
+
+Students which were not sampled yet keep initial_loss, by default the loss
+of predicting 0.5 for every answer, which is above the loss of most students
+once the model has learned something, so they are likely to be visited soon.
+
+An epoch of an ASSISTDataProvider with a sampler attached (see
+ASSISTDataProvider.attach_sampler) draws epoch_size students, which may be
+fewer than N, so the probabilities are refreshed more often than once per
+pass over the data (sub-epochs).
+"""
+
+import numpy as np
+
+DEFAULT_UNIFORM = 0.5
+DEFAULT_DECAY = 0.9
+
+
+class LossSampler(object):
+    """Draws students with probabilities that grow with their recent loss."""
+
+    def __init__(self, num_students, uniform=DEFAULT_UNIFORM, decay=DEFAULT_DECAY,
+                 initial_loss=np.log(2), rng=None):
+        """
+        Args:
+            num_students (int): number of students (rows) of the provider.
+            uniform (float): fraction of the probability mass spread
+                uniformly over all students, in (0, 1].
+            decay (float): weight of the previous average when a student's
+                loss is updated, in [0, 1).
+            initial_loss (float): loss of the students not seen yet.
+            rng (RandomState): A seeded random number generator.
+        """
+        assert 0 < uniform <= 1, 'Expected uniform to be in (0, 1]. Got {}'.format(uniform)
+        assert 0 <= decay < 1, 'Expected decay to be in [0, 1). Got {}'.format(decay)
+        self.num_students = num_students
+        self.uniform = uniform
+        self.decay = decay
+        self.losses = np.full(num_students, initial_loss, dtype=np.float32)
+        self.num_updates = np.zeros(num_students, dtype=np.int32)
+        if rng is None:
+            rng = np.random.RandomState()
+        self.rng = rng
+
+    def probabilities(self):
+        """Return the probability of drawing each student."""
+        losses = self.losses.astype(np.float64)
+        total = losses.sum()
+        if total <= 0:
+            return np.full(self.num_students, 1. / self.num_students)
+        return self.uniform / self.num_students + (1 - self.uniform) * losses / total
+
+    def sample(self, size):
+        """Draw size students with replacement. Returns their indices and
+        the importance weights 1 / (N * p) of their losses."""
+        probabilities = self.probabilities()
+        indices = self.rng.choice(self.num_students, size=size, p=probabilities)
+        weights = 1. / (self.num_students * probabilities[indices])
+        return indices, weights.astype(np.float32)
+
+    def update(self, indices, lengths, loss_per_example):
+        """Update the average loss of the students indices from the
+        (unweighted) losses of their answers, given in student order with
+        lengths[i] answers for indices[i]."""
+        lengths = np.asarray(lengths)
+        student_losses = np.bincount(np.repeat(np.arange(len(lengths)), lengths),
+                                     weights=loss_per_example,
+                                     minlength=len(lengths)) / np.maximum(lengths, 1)
+        # a student drawn several times into the same batch is updated once
+        indices, first = np.unique(indices, return_index=True)
+        has_answers = lengths[first] > 0
+        indices, student_losses = indices[has_answers], student_losses[first][has_answers]
+        self.losses[indices] = (self.decay * self.losses[indices] +
+                                (1 - self.decay) * student_losses)
+        self.num_updates[indices] += 1
+
+    def summary(self):
+        """Return statistics of the tracked losses, e.g. for logging."""
+        return {'sampler_seen_fraction': float(np.mean(self.num_updates > 0)),
+                'sampler_mean_loss': float(self.losses.mean()),
+                'sampler_max_weight': float(1. / (self.num_students *
+                                                  self.probabilities().min()))}
+
+
+def answer_weights(weights, lengths):
+    """Repeat the weight of every student for each of its answers, in the
+    order of the targets of a batch."""
+    return np.repeat(weights, lengths).astype(np.float32)
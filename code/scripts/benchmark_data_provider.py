@@ -0,0 +1,130 @@
+# Measure the time of the data pipeline: preprocessing, loading, shuffling,
+# splitting, truncating and batching with ASSISTDataProvider. Without
+# --data_dir, a synthetic data set of the given size is generated first.
+# Results are appended as json lines to --output, so they can be compared
+# across commits.
+
+from benchmark_utils import append_record
+from data_provider import ASSISTDataProvider
+from make_synthetic_assist_data import preprocess, write_synthetic_csv
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from time import time
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+parser = ArgumentParser(description='Benchmark ASSISTDataProvider.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--data_dir', type=str, default=None,
+                    help='Directory with preprocessed data. If not given, '
+                         'synthetic data is generated in a temporary directory')
+parser.add_argument('--which_year', type=str, default='09',
+                    help='Year of ASSIST data. Either 09 or 15')
+parser.add_argument('--num_students', type=int, default=4000,
+                    help='Number of synthetic students')
+parser.add_argument('--num_problems', type=int, default=124,
+                    help='Number of synthetic problem sets')
+parser.add_argument('--length_dist', type=str, default='lognormal',
+                    help='Distribution of the number of answers per synthetic student')
+parser.add_argument('--mean_length', type=int, default=30,
+                    help='Approximate mean number of answers per synthetic student')
+parser.add_argument('--max_length', type=int, default=1000,
+                    help='Maximum number of answers per synthetic student')
+parser.add_argument('--plus_minus_feats', dest='plus_minus_feats', action='store_true',
+                    help='use +/- for feature encoding')
+parser.set_defaults(plus_minus_feats=False)
+parser.add_argument('--max_time_steps', type=int, default=100,
+                    help='limit length of students sequences of answers')
+parser.add_argument('--batch', type=int, default=32,
+                    help='Batch size')
+parser.add_argument('--repeats', type=int, default=5,
+                    help='Number of repetitions of the fast operations')
+parser.add_argument('--output', type=str, default='benchmarks.jsonl',
+                    help='File the results are appended to')
+args = parser.parse_args()
+
+
+def timed(function, repeats=1):
+    """Return the result of the last call and the mean time per call."""
+    start = time()
+    for _ in range(repeats):
+        result = function()
+    return result, (time() - start) / repeats
+
+
+record = {'benchmark': 'data_provider',
+          'plus_minus_feats': args.plus_minus_feats,
+          'max_time_steps': args.max_time_steps,
+          'batch': args.batch}
+
+data_dir = args.data_dir
+if data_dir is None:
+    data_dir = tempfile.mkdtemp()
+    csv_filename = 'synthetic.csv'
+    rng = np.random.RandomState(0)
+    _, record['write_csv_sec'] = timed(lambda: write_synthetic_csv(
+        os.path.join(data_dir, csv_filename), args.num_students, args.num_problems,
+        args.length_dist, args.mean_length, args.max_length, rng))
+    _, record['preprocess_sec'] = timed(lambda: preprocess(
+        data_dir, csv_filename, args.which_year, 'train', args.plus_minus_feats))
+    record.update({'synthetic': True,
+                   'length_dist': args.length_dist,
+                   'mean_length': args.mean_length,
+                   'max_length': args.max_length})
+else:
+    record['data_dir'] = os.path.abspath(data_dir)
+
+try:
+    provider, record['load_sec'] = timed(lambda: ASSISTDataProvider(
+        data_dir, which_set='train', which_year=args.which_year,
+        batch_size=args.batch, use_plus_minus_feats=args.plus_minus_feats))
+    record.update({'num_students': provider.inputs.shape[0],
+                   'max_num_ans': provider.max_num_ans,
+                   'max_prob_set_id': provider.max_prob_set_id,
+                   'encoding_dim': provider.encoding_dim,
+                   'num_answers': int(sum(len(student) for student in provider.targets))})
+
+    _, record['shuffle_sec'] = timed(provider.shuffle, args.repeats)
+
+    threshold = min(args.max_time_steps, provider.max_num_ans)
+    _, record['truncate_sequences_sec'] = timed(lambda: provider.truncate_sequences(
+        provider.inputs, provider.target_ids, provider.targets, threshold))
+
+    (train_set, val_set), record['train_validation_split_sec'] = timed(
+        lambda: provider.train_validation_split(args.max_time_steps))
+
+    batch_slice = slice(0, args.batch)
+    _, record['transform_batch_sec'] = timed(lambda: train_set.transform_batch(
+        train_set.inputs[batch_slice], train_set.target_ids[batch_slice],
+        train_set.targets[batch_slice]), args.repeats)
+
+    def iterate_epoch():
+        num_batches, num_answers = 0, 0
+        for inputs, targets, target_ids in train_set:
+            num_batches += 1
+            num_answers += len(targets)
+        return num_batches, num_answers
+
+    (num_batches, num_answers), record['epoch_sec'] = timed(iterate_epoch)
+    record['epoch_batches'] = num_batches
+    record['epoch_batches_per_sec'] = num_batches / record['epoch_sec']
+    record['epoch_answers_per_sec'] = num_answers / record['epoch_sec']
+
+    # packed rows: the model runs fewer (full) rows for the same answers
+    train_set, record['pack_sec'] = timed(train_set.pack)
+    record['packed_steps_fraction'] = num_answers / float(
+        train_set.inputs.shape[0] * train_set.max_num_ans)
+    (num_batches, num_answers), record['packed_epoch_sec'] = timed(iterate_epoch)
+    record['packed_epoch_batches'] = num_batches
+    record['packed_epoch_answers_per_sec'] = num_answers / record['packed_epoch_sec']
+finally:
+    if args.data_dir is None:
+        shutil.rmtree(data_dir)
+
+append_record(args.output, record)
+for key, value in sorted(record.items()):
+    if key.endswith('_sec') or key.endswith('_per_sec'):
+        print('{:>30}: {:.4f}'.format(key, value))
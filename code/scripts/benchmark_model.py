@@ -0,0 +1,161 @@
+# Measure the training throughput and peak memory of LstmModel on the CPU
+# for a grid of shapes, batch sizes and optimisers, using synthetic feeds.
+# Every configuration is run in a fresh process so that the peak memory of
+# one configuration does not hide that of the next. Results are appended as
+# json lines to --output.
+
+from benchmark_utils import append_record, run_child, synthetic_batch
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from time import time
+
+import itertools
+import json
+import sys
+import numpy as np
+
+# input representations LstmModel can be fed with, by the dtype of the fed
+# inputs: float32, or int8 as ASSISTDataProvider feeds uncompressed encodings
+# (cast to float32 in the graph)
+INPUT_DTYPES = {'dense': np.float32, 'int8': np.int8}
+INPUT_REPRESENTATIONS = ['dense', 'int8']
+
+# size of the feature vector of each answer for the encodings of the provider
+FEATURE_LENS = {
+    'onehot': lambda n_questions: 2 * n_questions + 1,
+    'plus_minus': lambda n_questions: n_questions + 1,
+    'compressed': lambda n_questions: 100}
+
+
+def int_list(value):
+    return [int(x) for x in value.split(',')]
+
+
+def str_list(value):
+    return value.split(',')
+
+
+parser = ArgumentParser(description='Benchmark LstmModel training.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--max_time_steps', type=int_list, default=[50, 100, 200],
+                    help='Comma-separated sequence lengths')
+parser.add_argument('--encoding', type=str_list, default=['onehot'],
+                    help='Comma-separated input encodings: onehot, plus_minus, '
+                         'compressed')
+parser.add_argument('--n_distinct_questions', type=int, default=124,
+                    help='Number of distinct problem sets')
+parser.add_argument('--num_hidden_units', type=int_list, default=[200],
+                    help='Comma-separated numbers of hidden units')
+parser.add_argument('--batch', type=int_list, default=[32],
+                    help='Comma-separated batch sizes')
+parser.add_argument('--optimisation', type=str_list, default=['sgd'],
+                    help='Comma-separated optimisation methods')
+parser.add_argument('--input_repr', type=str_list, default=INPUT_REPRESENTATIONS,
+                    help='Comma-separated input representations, out of: ' +
+                         ', '.join(INPUT_REPRESENTATIONS))
+parser.add_argument('--num_threads', type=int, default=0,
+                    help='TensorFlow threads. 0 lets TensorFlow decide')
+parser.add_argument('--warmup_steps', type=int, default=5,
+                    help='Untimed steps run before timing')
+parser.add_argument('--steps', type=int, default=20,
+                    help='Timed training steps')
+parser.add_argument('--output', type=str, default='benchmarks.jsonl',
+                    help='File the results are appended to')
+parser.add_argument('--config', type=str, default=None,
+                    help='Internal: run only this json encoded configuration '
+                         'and print the result')
+args = parser.parse_args()
+
+
+def run_config(config):
+    from LstmModel import LstmModel
+    from perf_config import DEFAULT_PERF_CONFIG, apply_perf_config
+    from profiling import peak_rss_mb, reset_peak_rss
+    import tensorflow as tf
+
+    settings = dict(DEFAULT_PERF_CONFIG, num_threads=args.num_threads)
+    session_config = apply_perf_config(settings)
+    n_questions = args.n_distinct_questions
+    feature_len = FEATURE_LENS[config['encoding']](n_questions)
+
+    start = time()
+    model = LstmModel(max_time_steps=config['max_time_steps'],
+                      feature_len=feature_len,
+                      n_distinct_questions=n_questions,
+                      batch_size=config['batch'],
+                      input_dtype=INPUT_DTYPES[config['input_repr']])
+    model.build_graph(n_hidden_units=config['num_hidden_units'],
+                      optimisation=config['optimisation'])
+    build_sec = time() - start
+
+    rng = np.random.RandomState(0)
+    batches = [synthetic_batch(config['batch'], config['max_time_steps'], feature_len,
+                               n_questions, rng)
+               for _ in range(4)]
+    batches = [(inputs.astype(INPUT_DTYPES[config['input_repr']]), targets, target_ids)
+               for inputs, targets, target_ids in batches]
+
+    reset_peak_rss()
+    with tf.Session(config=session_config) as sess:
+        sess.run(tf.global_variables_initializer())
+
+        def step(i):
+            inputs, targets, target_ids = batches[i % len(batches)]
+            sess.run(model.training,
+                     feed_dict={model.inputs: inputs,
+                                model.targets: targets,
+                                model.target_ids: target_ids,
+                                model.learning_rate: 0.1,
+                                model.keep_prob: 0.6})
+            return len(targets)
+
+        start = time()
+        for i in range(args.warmup_steps):
+            step(i)
+        warmup_sec = time() - start
+        start = time()
+        num_answers = sum(step(i) for i in range(args.steps))
+        elapsed = time() - start
+
+    return {'feature_len': feature_len,
+            'build_sec': build_sec,
+            'warmup_sec': warmup_sec,
+            'steps_per_sec': args.steps / elapsed,
+            'students_per_sec': args.steps * config['batch'] / elapsed,
+            'answers_per_sec': num_answers / elapsed,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+if args.config:
+    print(json.dumps(run_config(json.loads(args.config))))
+    sys.exit()
+
+for input_repr in args.input_repr:
+    assert input_repr in INPUT_REPRESENTATIONS, (
+        'Expected input_repr to be one of {}. Got {}'.format(INPUT_REPRESENTATIONS, input_repr)
+    )
+
+names = ['max_time_steps', 'encoding', 'num_hidden_units', 'batch', 'optimisation',
+         'input_repr']
+print(' '.join('{:>14}'.format(name) for name in names) +
+      '{:>12}{:>14}{:>12}'.format('steps/sec', 'answers/sec', 'peak MB'))
+for values in itertools.product(*[getattr(args, name) for name in names]):
+    config = dict(zip(names, values))
+    if config['input_repr'] == 'int8' and config['encoding'] == 'compressed':
+        # compressed inputs are real valued, so they are always fed as float32
+        continue
+    options = {'n_distinct_questions': args.n_distinct_questions,
+               'num_threads': args.num_threads,
+               'warmup_steps': args.warmup_steps,
+               'steps': args.steps,
+               'config': json.dumps(config)}
+    result = run_child(__file__, options)
+    record = dict(config, benchmark='model', n_distinct_questions=args.n_distinct_questions,
+                  num_threads=args.num_threads, steps=args.steps, **result)
+    append_record(args.output, record)
+    if 'error' in result:
+        summary = '{:>12}'.format('failed')
+    else:
+        summary = '{:>12.2f}{:>14.0f}{:>12.0f}'.format(
+            result['steps_per_sec'], result['answers_per_sec'], result['peak_rss_mb'])
+    print(' '.join('{:>14}'.format(value) for value in values) + summary)
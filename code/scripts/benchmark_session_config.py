@@ -0,0 +1,130 @@
+# Measure the training throughput of LstmModel under different session
+# performance settings (see perf_config.py), using synthetic batches.
+# Every setting is run in a fresh process, since TensorFlow keeps the
+# thread pools of the first session for the lifetime of the process.
+
+from benchmark_utils import append_record, run_child, synthetic_batch
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from time import time
+
+import itertools
+import json
+import os
+import sys
+import numpy as np
+
+parser = ArgumentParser(description='Benchmark session performance settings.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--settings', type=str, default=None,
+                    help='json file with a list of performance settings to '
+                         'compare. By default a grid over thread counts, graph '
+                         'optimisation levels and XLA is used')
+parser.add_argument('--max_time_steps', type=int, default=100,
+                    help='Length of the synthetic sequences')
+parser.add_argument('--n_distinct_questions', type=int, default=124,
+                    help='Number of distinct problem sets')
+parser.add_argument('--num_hidden_units', type=int, default=200,
+                    help='Number of hidden units in the LSTM cell')
+parser.add_argument('--batch', type=int, default=32,
+                    help='Batch size')
+parser.add_argument('--optimisation', type=str, default='sgd',
+                    help='optimisation method')
+parser.add_argument('--warmup_steps', type=int, default=5,
+                    help='Untimed steps run before timing')
+parser.add_argument('--steps', type=int, default=20,
+                    help='Timed training steps')
+parser.add_argument('--output', type=str, default='benchmarks.jsonl',
+                    help='File the results are appended to')
+parser.add_argument('--setting', type=str, default=None,
+                    help=('Internal: run only this json encoded setting and '
+                          'print the result'))
+args = parser.parse_args()
+
+
+def default_settings():
+    num_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else os.cpu_count()
+    threads = sorted(set([1, 2, max(1, num_cpus // 2), num_cpus]))
+    return [{'num_threads': num_threads, 'graph_opt_level': level, 'xla': xla}
+            for num_threads, level, xla in itertools.product(
+                threads, ['default', 'L0'], [False, True])]
+
+
+def run_setting(setting):
+    from LstmModel import LstmModel
+    from perf_config import DEFAULT_PERF_CONFIG, apply_perf_config
+    import tensorflow as tf
+
+    settings = dict(DEFAULT_PERF_CONFIG)
+    settings.update(setting)
+    config = apply_perf_config(settings)
+
+    feature_len = 2 * args.n_distinct_questions + 1
+    model = LstmModel(max_time_steps=args.max_time_steps,
+                      feature_len=feature_len,
+                      n_distinct_questions=args.n_distinct_questions,
+                      batch_size=args.batch)
+    model.build_graph(n_hidden_units=args.num_hidden_units,
+                      optimisation=args.optimisation)
+
+    rng = np.random.RandomState(0)
+    batches = [synthetic_batch(args.batch, args.max_time_steps, feature_len,
+                               args.n_distinct_questions, rng)
+               for _ in range(4)]
+
+    with tf.Session(config=config) as sess:
+        sess.run(tf.global_variables_initializer())
+
+        def step(i):
+            inputs, targets, target_ids = batches[i % len(batches)]
+            sess.run(model.training,
+                     feed_dict={model.inputs: inputs,
+                                model.targets: targets,
+                                model.target_ids: target_ids,
+                                model.learning_rate: 0.1,
+                                model.keep_prob: 0.6})
+            return len(targets)
+
+        for i in range(args.warmup_steps):
+            step(i)
+        start = time()
+        num_answers = sum(step(i) for i in range(args.steps))
+        elapsed = time() - start
+
+    return {'steps_per_sec': args.steps / elapsed,
+            'students_per_sec': args.steps * args.batch / elapsed,
+            'answers_per_sec': num_answers / elapsed}
+
+
+if args.setting:
+    print(json.dumps(run_setting(json.loads(args.setting))))
+    sys.exit()
+
+if args.settings:
+    with open(args.settings) as f:
+        settings_list = json.load(f)
+else:
+    settings_list = default_settings()
+
+shape = {'benchmark': 'session_config',
+         'max_time_steps': args.max_time_steps,
+         'n_distinct_questions': args.n_distinct_questions,
+         'num_hidden_units': args.num_hidden_units,
+         'batch': args.batch,
+         'optimisation': args.optimisation,
+         'steps': args.steps}
+
+print('{:>60}  {:>10}  {:>12}'.format('setting', 'steps/sec', 'answers/sec'))
+for setting in settings_list:
+    options = {name: getattr(args, name) for name in [
+        'max_time_steps', 'n_distinct_questions', 'num_hidden_units', 'batch',
+        'optimisation', 'warmup_steps', 'steps']}
+    options['setting'] = json.dumps(setting)
+    result = run_child(__file__, options)
+    record = dict(shape, setting=setting, **result)
+    append_record(args.output, record)
+    print('{:>60}  {:>10}  {:>12}'.format(
+        json.dumps(setting, sort_keys=True),
+        '{:.2f}'.format(result['steps_per_sec']) if 'steps_per_sec' in result else 'failed',
+        '{:.0f}'.format(result['answers_per_sec']) if 'answers_per_sec' in result else ''))
@@ -0,0 +1,72 @@
+"""Helpers shared by the benchmark scripts."""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import gmtime, strftime
+
+import numpy as np
+
+# make the modules in code/ importable from the scripts
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+
+def synthetic_batch(batch_size, max_time_steps, encoding_dim, n_questions,
+                    rng, full_length=False):
+    """Return (inputs, targets, target_ids) shaped like a batch of
+    ASSISTDataProvider, for random students.
+
+    Each student answers between 1 and max_time_steps questions (exactly
+    max_time_steps if full_length), the rest of the sequence is padding."""
+    if full_length:
+        lengths = np.full(batch_size, max_time_steps)
+    else:
+        lengths = rng.randint(1, max_time_steps + 1, size=batch_size)
+    steps = np.arange(max_time_steps)
+    mask = steps[None, :] < lengths[:, None]
+
+    inputs = np.zeros((batch_size, max_time_steps, encoding_dim), dtype=np.float32)
+    students, times = np.nonzero(mask)
+    inputs[students, times, rng.randint(encoding_dim, size=len(students))] = 1
+
+    target_ids = np.zeros((batch_size, max_time_steps, n_questions), dtype=np.int32)
+    target_ids[students, times, rng.randint(n_questions, size=len(students))] = 1
+    targets = rng.randint(2, size=len(students)).astype(np.float32)
+    return inputs, targets, target_ids.reshape(-1)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=CODE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_record(path, record):
+    """Append a benchmark result, with the time, host and git revision it
+    was measured at, as one json line to path."""
+    record = dict(record)
+    record.setdefault('time', strftime('%Y-%m-%dT%H:%M:%SZ', gmtime()))
+    record.setdefault('host', platform.node())
+    record.setdefault('git_revision', git_revision())
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def run_child(script, options):
+    """Run script (a benchmark which prints its result as json on the last
+    line of its output) in a fresh process with the given --name value
+    options. Returns the result, or a dict with an error message."""
+    command = [sys.executable, os.path.abspath(script)]
+    for name, value in options.items():
+        command.extend(['--' + name, value if isinstance(value, str) else json.dumps(value)])
+    try:
+        output = subprocess.check_output(command, stderr=subprocess.DEVNULL)
+        return json.loads(output.decode().strip().splitlines()[-1])
+    except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+        return {'error': str(e)}
@@ -0,0 +1,112 @@
+# Check that the compact dtypes of the data pipeline (int8 inputs, target ids
+# and targets) give exactly the same batches as float64 data, and report how
+# many bytes a batch takes with each. A synthetic data set is generated and
+# split into train/valid with truncation, once preprocessed by
+# preprocess_assist_data.py into compact data and once encoded from the raw csv
+# file into float64 matrices by a separate, straightforward reference encoder.
+# Exits with status 1 if any batch differs, so it can be run as part of CI.
+
+from make_synthetic_assist_data import preprocess, write_synthetic_csv
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from data_provider import ASSISTDataProvider, ragged_array  # noqa: E402
+
+parser = ArgumentParser(description='Check the compact dtypes of the data pipeline.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--num_students', type=int, default=500,
+                    help='Number of synthetic students')
+parser.add_argument('--num_problems', type=int, default=124,
+                    help='Number of distinct problem sets')
+parser.add_argument('--max_time_steps', type=int, default=50,
+                    help='Length sequences are truncated to')
+parser.add_argument('--batch', type=int, default=32,
+                    help='Batch size')
+args = parser.parse_args()
+
+
+def reference_data(csv_path, use_plus_minus):
+    """Encode the students of a raw csv file, one answer at a time, into
+    float64 sparse matrices and targets as lists, as the pipeline used to
+    hold them. Students with fewer than 3 answers are skipped, as in
+    preprocess_assist_data.py."""
+    with open(csv_path) as f:
+        rows = [[int(x) for x in row] for row in csv.reader(f)]
+    students = [([problem + 1 for problem in problems], marks)
+                for length, problems, marks in zip(rows[::3], rows[1::3], rows[2::3])
+                if length[0] >= 3]
+    max_num_ans = max(len(problems) for problems, _ in students)
+    max_prob_set_id = max(max(problems) for problems, _ in students)
+    encoding_dim = max_prob_set_id + 1 if use_plus_minus else 2 * max_prob_set_id + 1
+
+    inputs = sp.lil_matrix((len(students), max_num_ans * encoding_dim), dtype=np.float64)
+    target_ids = sp.lil_matrix((len(students), max_num_ans * max_prob_set_id),
+                               dtype=np.float64)
+    targets = []
+    for i, (problems, marks) in enumerate(students):
+        # every answer but the last is an input, every answer but the first a target
+        for step in range(len(problems) - 1):
+            if use_plus_minus:
+                inputs[i, step * encoding_dim + problems[step]] = 1. if marks[step] else -1.
+            else:
+                column = problems[step] + marks[step] * max_prob_set_id
+                inputs[i, step * encoding_dim + column] = 1.
+            target_ids[i, step * max_prob_set_id + problems[step + 1] - 1] = 1.
+        targets.append(list(marks[1:]))
+    return {'inputs': sp.csr_matrix(inputs),
+            'targets': ragged_array(targets),
+            'target_ids': sp.csr_matrix(target_ids),
+            'max_num_ans': max_num_ans,
+            'max_prob_set_id': max_prob_set_id,
+            'encoding_dim': encoding_dim}
+
+
+def batch_bytes(batch):
+    return sum(array.nbytes for array in batch)
+
+
+data_dir = tempfile.mkdtemp()
+failures = []
+try:
+    csv_path = os.path.join(data_dir, 'synthetic.csv')
+    write_synthetic_csv(csv_path, args.num_students, args.num_problems,
+                        rng=np.random.RandomState(0))
+    for use_plus_minus in [False, True]:
+        preprocess(data_dir, 'synthetic.csv', '09', 'train', use_plus_minus)
+        compact = ASSISTDataProvider(data_dir, use_plus_minus_feats=use_plus_minus,
+                                     batch_size=args.batch, shuffle_order=False)
+        reference = ASSISTDataProvider(data_dir, use_plus_minus_feats=use_plus_minus,
+                                       batch_size=args.batch, shuffle_order=False,
+                                       data=reference_data(csv_path, use_plus_minus))
+        encoding = 'plus_minus' if use_plus_minus else 'onehot'
+        splits = zip(compact.train_validation_split(args.max_time_steps),
+                     reference.train_validation_split(args.max_time_steps))
+        for split, (compact_split, reference_split) in zip(['train', 'valid'], splits):
+            compact_split.shuffle_order = reference_split.shuffle_order = False
+            compact_bytes, reference_bytes = 0, 0
+            for compact_batch, reference_batch in zip(compact_split, reference_split):
+                compact_bytes += batch_bytes(compact_batch)
+                reference_bytes += batch_bytes(reference_batch)
+                for name, x, y in zip(['inputs', 'targets', 'target_ids'],
+                                      compact_batch, reference_batch):
+                    if not np.array_equal(x.astype(np.float32), y.astype(np.float32)):
+                        failures.append('{} {} {}'.format(encoding, split, name))
+            print('{:<10} {:<5} float64: {:>8.1f} MB  compact: {:>8.1f} MB  ({:.1f}x less)'
+                  .format(encoding, split, reference_bytes / 2**20, compact_bytes / 2**20,
+                          reference_bytes / max(compact_bytes, 1)))
+finally:
+    shutil.rmtree(data_dir)
+
+if failures:
+    print('Batches differ: ' + ', '.join(sorted(set(failures))))
+    sys.exit(1)
+print('All batches are equal')
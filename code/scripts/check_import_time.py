@@ -0,0 +1,74 @@
+# Check that the modules and entry points which do not need TensorFlow,
+# matplotlib or scikit-learn do not import them, and that they start within
+# a time budget. Every check runs in a fresh interpreter. Exits with status 1
+# if any check fails, so it can be run as part of CI.
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import json
+import os
+import subprocess
+import sys
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ['tensorflow', 'matplotlib', 'sklearn']
+
+# modules which must be importable without any of HEAVY_MODULES
+LIGHT_MODULES = ['utils', 'metrics_log', 'PlotResult', 'data_provider', 'perf_config',
+                 'process_utils', 'profiling', 'cross_validation', 'distributed',
+                 'validation_worker', 'sampler', 'mastery']
+
+# commands which must start (and exit) within the command budget
+COMMANDS = [['run_training.py', '--help'],
+            ['run_training.py', '--data_dir', '/nonexistent'],  # fails on the data path
+            ['run_sweep.py', '--help'],
+            ['export_predictions.py', '--help'],
+            ['validation_worker.py', '--help'],
+            ['query_mastery.py', '--help'],
+            [os.path.join('scripts', 'compare_runs.py'), '--help']]
+
+MEASURE_IMPORT = '''
+import json, sys, time
+start = time.time()
+import {module}
+print(json.dumps({{'seconds': time.time() - start,
+                   'heavy': [m for m in {heavy} if m in sys.modules]}}))
+'''
+
+parser = ArgumentParser(description='Check import times of the light modules.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('--module_budget', type=float, default=0.5,
+                    help='Maximum seconds to import a light module')
+parser.add_argument('--command_budget', type=float, default=1.0,
+                    help='Maximum seconds to run a command')
+args = parser.parse_args()
+
+failures = []
+for module in LIGHT_MODULES:
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE_IMPORT.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=CODE_DIR)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    ok = result['seconds'] <= args.module_budget and not result['heavy']
+    print('{:<6} import {:<20} {:.3f}s {}'.format(
+        'ok' if ok else 'FAIL', module, result['seconds'],
+        'imports ' + ', '.join(result['heavy']) if result['heavy'] else ''))
+    if not ok:
+        failures.append(module)
+
+for command in COMMANDS:
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         'import json, subprocess, sys, time; start = time.time(); '
+         'subprocess.call([sys.executable] + sys.argv[1:], stdout=subprocess.DEVNULL, '
+         'stderr=subprocess.DEVNULL); print(json.dumps(time.time() - start))'] + command,
+        cwd=CODE_DIR)
+    seconds = json.loads(output.decode().strip())
+    ok = seconds <= args.command_budget
+    print('{:<6} run    {:<20} {:.3f}s'.format('ok' if ok else 'FAIL', ' '.join(command), seconds))
+    if not ok:
+        failures.append(' '.join(command))
+
+if failures:
+    print('{} checks failed'.format(len(failures)))
+    sys.exit(1)
@@ -0,0 +1,127 @@
+# Compare training runs from their metrics logs (metrics.csv in each run
+# directory). Prints a table of the best and last value of a metric per run,
+# optionally with some of the arguments of each run, and can plot the
+# learning curves of all runs into one figure. With --target, also prints how
+# many students were trained on (from timing.json) until the metric first
+# reached the target, e.g. to compare importance sampling with shuffling.
+# Does not import TensorFlow.
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import glob
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from metrics_log import METRICS_FILENAME, read_metrics  # noqa: E402
+
+parser = ArgumentParser(description='Compare training runs.',
+                        formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument('runs', nargs='+',
+                    help='Run directories, or directories/globs containing them')
+parser.add_argument('--metric', type=str, default='auc',
+                    help='Metric to compare: loss, accuracy or auc')
+parser.add_argument('--split', type=str, default='valid',
+                    help='Split to compare: train or valid')
+parser.add_argument('--show_args', type=str, default='',
+                    help='Comma-separated arguments of the runs to show (from args.json)')
+parser.add_argument('--plot', type=str, default=None,
+                    help='Save the learning curves of all runs to this image file')
+parser.add_argument('--target', type=float, default=None,
+                    help='Also show the epoch and number of training students '
+                         'after which the metric first reached this value')
+parser.add_argument('--top', type=int, default=0,
+                    help='Only show (and plot) the best x runs. 0 shows all')
+args = parser.parse_args()
+
+
+def find_runs(paths):
+    """Return the run directories (directories with a metrics log) in or
+    below paths, which may contain globs."""
+    runs = []
+    for path in paths:
+        for match in sorted(glob.glob(path)):
+            if os.path.isfile(os.path.join(match, METRICS_FILENAME)):
+                runs.append(match)
+            else:
+                runs.extend(sorted(os.path.dirname(f) for f in glob.glob(
+                    os.path.join(match, '**', METRICS_FILENAME), recursive=True)))
+    return runs
+
+
+def students_to_target(run, metrics, values):
+    """Return the first epoch at which values reached args.target and the
+    number of students trained on up to it, or (None, None)."""
+    reached = values <= args.target if lower_is_better else values >= args.target
+    if not reached.any():
+        return None, None
+    epoch = metrics['epoch'][np.argmax(reached)]
+    timing_path = os.path.join(run, 'timing.json')
+    if not os.path.isfile(timing_path):
+        return epoch, None
+    with open(timing_path) as f:
+        timings = json.load(f)
+    if any('students' not in timing for timing in timings):
+        # written before the number of students was recorded
+        return epoch, None
+    return epoch, sum(timing['students'] for timing in timings if timing['epoch'] <= epoch)
+
+
+lower_is_better = args.metric == 'loss'
+shown_args = [name for name in args.show_args.split(',') if name]
+rows = []
+for run in find_runs(args.runs):
+    metrics = read_metrics(run).get(args.split)
+    if metrics is None or len(metrics['epoch']) == 0:
+        continue
+    values = metrics[args.metric]
+    best = np.nanargmin(values) if lower_is_better else np.nanargmax(values)
+    run_args = {}
+    if os.path.isfile(os.path.join(run, 'args.json')):
+        with open(os.path.join(run, 'args.json')) as f:
+            run_args = json.load(f)
+    target_epoch, target_students = (students_to_target(run, metrics, values)
+                                     if args.target is not None else (None, None))
+    rows.append({'run': run,
+                 'epochs': len(values),
+                 'best': values[best],
+                 'best_epoch': metrics['epoch'][best],
+                 'last': values[-1],
+                 'target_epoch': target_epoch,
+                 'target_students': target_students,
+                 'args': [run_args.get(name) for name in shown_args],
+                 'metrics': metrics})
+
+rows.sort(key=lambda row: row['best'], reverse=not lower_is_better)
+if args.top:
+    rows = rows[:args.top]
+
+width = max([len('run')] + [len(row['run']) for row in rows])
+target_columns = ['target_epoch', 'target_students'] if args.target is not None else []
+print('{:<{}}  {:>6}  {:>8}  {:>10}  {:>8}'.format(
+    'run', width, 'epochs', 'best', 'best_epoch', 'last') +
+    ''.join('  {:>15}'.format(name) for name in target_columns) +
+    ''.join('  {:>12}'.format(name) for name in shown_args))
+for row in rows:
+    print('{:<{}}  {:>6}  {:>8.4f}  {:>10}  {:>8.4f}'.format(
+        row['run'], width, row['epochs'], row['best'], row['best_epoch'], row['last']) +
+        ''.join('  {:>15}'.format('-' if row[name] is None else str(row[name]))
+                for name in target_columns) +
+        ''.join('  {:>12}'.format(str(value)) for value in row['args']))
+
+if args.plot:
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+
+    plt.figure()
+    for row in rows:
+        plt.plot(row['metrics']['epoch'], row['metrics'][args.metric],
+                 label=os.path.basename(os.path.normpath(row['run'])))
+    plt.legend(fontsize='small')
+    plt.xlabel('Epoch')
+    plt.ylabel(args.metric)
+    plt.title('{} per epoch ({})'.format(args.metric, args.split))
+    plt.savefig(args.plot)
@@ -0,0 +1,110 @@
+# Generate a synthetic data set in the format of the ASSIST csv files and,
+# optionally, preprocess it with preprocess_assist_data.py into the
+# -inputs/-targetids/-targets npz files read by ASSISTDataProvider.
+# Useful for benchmarking without access to the real data.
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import csv
+import os
+import subprocess
+import sys
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def sample_lengths(num_students, length_dist, mean_length, max_length, rng):
+    """Sample the number of answers of each student."""
+    if length_dist == 'uniform':
+        lengths = rng.randint(1, 2 * mean_length, size=num_students)
+    elif length_dist == 'geometric':
+        lengths = rng.geometric(1. / mean_length, size=num_students)
+    elif length_dist == 'lognormal':
+        # heavy tailed, like the real data: most students answer a few
+        # questions, a few answer hundreds
+        lengths = rng.lognormal(np.log(mean_length) - 0.5, 1.0, size=num_students)
+        lengths = np.ceil(lengths).astype(int)
+    else:
+        raise ValueError('Unknown length distribution {}'.format(length_dist))
+    return np.clip(lengths, 1, max_length)
+
+
+def write_synthetic_csv(csv_path, num_students, num_problems, length_dist='lognormal',
+                        mean_length=30, max_length=1000, rng=None):
+    """Write num_students students in the 3-line csv format:
+    number of answers, problem set ids (starting from 0), marks (0/1)."""
+    if rng is None:
+        rng = np.random.RandomState(0)
+    lengths = sample_lengths(num_students, length_dist, mean_length, max_length, rng)
+    # every problem has its own difficulty
+    difficulty = rng.uniform(0.2, 0.9, size=num_problems)
+    with open(csv_path, 'w') as f:
+        writer = csv.writer(f)
+        for i, length in enumerate(lengths):
+            problems = rng.randint(num_problems, size=length)
+            if i == 0:
+                # make sure the largest problem id appears, so max_prob_set_id
+                # does not depend on the sample
+                problems[0] = num_problems - 1
+            marks = (rng.rand(length) < difficulty[problems]).astype(int)
+            writer.writerow([length])
+            writer.writerow(problems)
+            writer.writerow(marks)
+    return lengths
+
+
+def preprocess(data_dir, csv_filename, which_year, which_set, use_plus_minus):
+    """Run preprocess_assist_data.py on a csv file."""
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, 'preprocess_assist_data.py'),
+               '--data_dir', data_dir,
+               '--csv_filename', csv_filename,
+               '--which_year', which_year,
+               '--which_set', which_set]
+    if use_plus_minus:
+        # the script parses this flag with type=bool, so any non-empty value is True
+        command.extend(['--use_plus_minus', '1'])
+    subprocess.check_call(command)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate synthetic ASSIST-shaped data.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--data_dir', type=str, required=True,
+                        help='Directory to write the data to')
+    parser.add_argument('--which_year', type=str, default='09',
+                        help='Year used in the output file names. 09 or 15')
+    parser.add_argument('--which_set', type=str, default='train',
+                        help='Set used in the output file names. train or test')
+    parser.add_argument('--num_students', type=int, default=4000,
+                        help='Number of students')
+    parser.add_argument('--num_problems', type=int, default=124,
+                        help='Number of distinct problem sets')
+    parser.add_argument('--length_dist', type=str, default='lognormal',
+                        help='Distribution of the number of answers per student. '
+                             'Either uniform, geometric or lognormal')
+    parser.add_argument('--mean_length', type=int, default=30,
+                        help='Approximate mean number of answers per student')
+    parser.add_argument('--max_length', type=int, default=1000,
+                        help='Maximum number of answers per student')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed')
+    parser.add_argument('--no-preprocess', dest='preprocess', action='store_false',
+                        help='only write the csv file')
+    parser.set_defaults(preprocess=True)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        os.makedirs(args.data_dir)
+    csv_filename = 'synthetic_{}_{}.csv'.format(args.which_year, args.which_set)
+    lengths = write_synthetic_csv(os.path.join(args.data_dir, csv_filename),
+                                  args.num_students, args.num_problems,
+                                  args.length_dist, args.mean_length, args.max_length,
+                                  np.random.RandomState(args.seed))
+    print('Wrote {} students with {} answers (max {}) to {}'.format(
+        len(lengths), lengths.sum(), lengths.max(), csv_filename))
+
+    if args.preprocess:
+        for use_plus_minus in [False, True]:
+            preprocess(args.data_dir, csv_filename, args.which_year, args.which_set,
+                       use_plus_minus)
@@ -138,17 +138,19 @@ for i in range(num_students):
     # add targets. Exclude first mark (since we have nothing to predict it with)
     targets.append(marks[1:])
 
-# save data to file
+# save data to file. All values are 0, 1 or -1, so they are stored as int8
 if use_plus_minus_feats:
-    converted_targets = 2 * np.array(plus_minus_ones) - 1
+    converted_targets = 2 * np.array(plus_minus_ones, dtype=np.int8) - 1
     sparse_inputs = sp.csr_matrix((converted_targets, (row_coordinates, column_coordinates)),
-                                  shape=(num_students, max_num_ans * encoding_dim))
+                                  shape=(num_students, max_num_ans * encoding_dim), dtype=np.int8)
 else:
-    sparse_inputs = sp.csr_matrix((np.ones(len(row_coordinates)), (row_coordinates, column_coordinates)),
-                                  shape=(num_students, max_num_ans * encoding_dim))
+    sparse_inputs = sp.csr_matrix((np.ones(len(row_coordinates), dtype=np.int8),
+                                   (row_coordinates, column_coordinates)),
+                                  shape=(num_students, max_num_ans * encoding_dim), dtype=np.int8)
 
-sparse_target_ids = sp.csr_matrix((np.ones(len(target_ids_row_coords)), (target_ids_row_coords, target_ids_col_coords)),
-                                  shape=(num_students, max_num_ans*max_prob_set_id))
+sparse_target_ids = sp.csr_matrix((np.ones(len(target_ids_row_coords), dtype=np.int8),
+                                   (target_ids_row_coords, target_ids_col_coords)),
+                                  shape=(num_students, max_num_ans*max_prob_set_id), dtype=np.int8)
 if use_plus_minus_feats:
     inputs_data_path = output_data_path + '-inputs-plus-minus'
 else:
@@ -159,7 +161,11 @@ targets_data_path = output_data_path + '-targets'
 
 sp.save_npz(inputs_data_path, sparse_inputs)
 sp.save_npz(target_ids_data_path, sparse_target_ids)
-np.savez(targets_data_path, targets=np.array(targets),
+# store targets as a 1d object array of per-student int8 arrays
+targets_array = np.empty(len(targets), dtype=object)
+for i, student_targets in enumerate(targets):
+    targets_array[i] = np.array(student_targets, dtype=np.int8)
+np.savez(targets_data_path, targets=targets_array,
          max_num_ans=max_num_ans, max_prob_set_id=max_prob_set_id)
 
 # DATA CHECKING
@@ -0,0 +1,212 @@
+"""Evaluation of the checkpoints of a training run in a separate process.
+
+With --background_validation, run_training.py saves its validation set to
+the run directory and starts this script as a child process instead of
+evaluating the model itself after every epoch. The worker waits for new
+checkpoints, evaluates each of them on the validation set with its own
+threads and writes the results where run_training.py would: the valid
+TensorBoard writer, the metrics log and results.json. Training never waits
+for validation; when it is done it creates DONE_FILENAME, and the worker
+exits once it has evaluated all checkpoints.
+
+With a worker, training keeps all its checkpoints, so none is deleted before
+it is evaluated, and lists them in the checkpoint state of the run directory
+once they are complete, which is where the worker finds them. The worker
+deletes all but the KEEP_CHECKPOINTS latest evaluated ones (as the Saver of
+training would) and saves the best one so far to best_checkpoint_path, which
+is not deleted.
+
+Usage (normally started by run_training.py):
+    python validation_worker.py --run_dir <run directory>
+"""
+
+from process_utils import script_command, thread_capped_env
+
+import json
+import os
+import re
+import subprocess
+
+VALID_DATA_DIRNAME = 'valid_data'
+DONE_FILENAME = 'training_done'
+BEST_DIRNAME = 'best'
+# checkpoints kept by the worker, like the default max_to_keep of tf.train.Saver
+KEEP_CHECKPOINTS = 5
+
+
+def best_checkpoint_path(save_dir, name):
+    """Path of the checkpoint with the best validation AUC of a run. It is
+    in its own directory, so saving it does not change the latest checkpoint
+    of save_dir. When saved by the worker, it holds the variables of the
+    model only (not those of the optimizer)."""
+    return os.path.join(save_dir, BEST_DIRNAME, '{}_best.ckpt'.format(name))
+
+
+def start_validation_worker(save_dir, val_set, num_threads):
+    """Save the data of val_set to save_dir and start a worker evaluating
+    the checkpoints of save_dir with num_threads threads. The output of the
+    worker goes to the output of this process."""
+    from data_provider import save_provider_data
+
+    save_provider_data(os.path.join(save_dir, VALID_DATA_DIRNAME), val_set.get_data())
+    return subprocess.Popen(
+        script_command('validation_worker.py', {'run_dir': save_dir,
+                                                'num_threads': num_threads}),
+        env=thread_capped_env(num_threads))
+
+
+def stop_validation_worker(save_dir, process):
+    """Tell the worker that no more checkpoints will come and wait until it
+    has evaluated the remaining ones."""
+    open(os.path.join(save_dir, DONE_FILENAME), 'w').close()
+    return process.wait()
+
+
+def checkpoint_epochs(run_dir, name):
+    """Return {epoch: checkpoint path} of the checkpoints of run_dir which
+    are listed in its checkpoint state, i.e. completely written, and still
+    exist."""
+    import tensorflow as tf
+
+    state = tf.train.get_checkpoint_state(run_dir)
+    if state is None:
+        return {}
+    pattern = re.compile(r'{}_(\d+)\.ckpt$'.format(re.escape(name)))
+    checkpoints = {}
+    for path in state.all_model_checkpoint_paths:
+        match = pattern.match(os.path.basename(path))
+        if match and os.path.exists(path + '.index'):
+            checkpoints[int(match.group(1))] = path
+    return checkpoints
+
+
+def remove_checkpoint(checkpoint):
+    """Delete the files of checkpoint, as tf.train.Saver does."""
+    directory, prefix = os.path.split(checkpoint)
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix + '.'):
+            os.remove(os.path.join(directory, filename))
+
+
+def main():
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    from time import sleep
+
+    from perf_config import add_perf_config_arguments, get_perf_config
+
+    parser = ArgumentParser(description='Evaluate the checkpoints of a training run.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--run_dir', type=str, required=True,
+                        help='Directory of the training run')
+    parser.add_argument('--poll_interval', type=float, default=2,
+                        help='Seconds between checks for new checkpoints')
+    add_perf_config_arguments(parser)
+    args = parser.parse_args()
+
+    with open(os.path.join(args.run_dir, 'args.json')) as f:
+        run_args = json.load(f)
+    perf_settings = get_perf_config(args)
+
+    from data_provider import ASSISTDataProvider, load_provider_data
+    from LstmModel import LstmModel
+    from metrics_log import MetricsLog
+    from perf_config import apply_perf_config
+    import tensorflow as tf
+
+    val_set = ASSISTDataProvider(
+        run_args['data_dir'],
+        which_set=run_args['which_set'],
+        which_year=run_args['which_year'],
+        batch_size=run_args['batch'],
+        shuffle_order=False,
+        data=load_provider_data(os.path.join(args.run_dir, VALID_DATA_DIRNAME)))
+    model = LstmModel(max_time_steps=val_set.max_num_ans,
+                      feature_len=val_set.encoding_dim,
+                      n_distinct_questions=val_set.max_prob_set_id,
+                      var_dropout=run_args['var_dropout'],
+                      batch_size=run_args['batch'],
+                      input_dtype=val_set.inputs.dtype,
+                      reset_channel=run_args.get('pack_sequences', False))
+    model.build_evaluation_graph(n_hidden_units=run_args['num_hidden_units'])
+    merged_aucacc = tf.summary.merge(model.summary_aucacc)
+    saver = tf.train.Saver()
+    best_saver = tf.train.Saver(max_to_keep=1)
+    best_path = best_checkpoint_path(args.run_dir, run_args['name'])
+
+    metrics_log = MetricsLog(args.run_dir)
+    # args.json is written when training starts
+    start_time = os.path.getmtime(os.path.join(args.run_dir, 'args.json'))
+    results_path = os.path.join(args.run_dir, 'results.json')
+    results = {'best_valid_auc': None, 'best_epoch': None, 'best_checkpoint': None}
+    evaluated = set()
+    kept = []
+    parent_pid = os.getppid()
+
+    with tf.Session(config=apply_perf_config(perf_settings)) as sess:
+        valid_writer = tf.summary.FileWriter(os.path.join(args.run_dir, 'valid'))
+        while True:
+            # check for the end of training first, so that checkpoints saved
+            # just before it are still found below
+            done = os.path.exists(os.path.join(args.run_dir, DONE_FILENAME))
+            new = sorted((epoch, path) for epoch, path in
+                         checkpoint_epochs(args.run_dir, run_args['name']).items()
+                         if epoch not in evaluated)
+            if not new:
+                # stop if training is done, or if it died before it was done
+                if done or os.getppid() != parent_pid:
+                    break
+                sleep(args.poll_interval)
+                continue
+
+            retry = False
+            for epoch, checkpoint in new:
+                try:
+                    saved_time = os.path.getmtime(checkpoint + '.index')
+                    saver.restore(sess, checkpoint)
+                except (OSError, tf.errors.NotFoundError, tf.errors.DataLossError):
+                    # retried at the next poll, unless training was already
+                    # done, so the checkpoint will not change any more
+                    if done:
+                        evaluated.add(epoch)
+                        print('Skipping checkpoint of epoch {}, it cannot be restored'
+                              .format(epoch))
+                    else:
+                        retry = True
+                    continue
+                evaluated.add(epoch)
+                sess.run([model.auc_init, model.acc_init, model.loss_init])
+                for inputs, targets, target_ids in val_set:
+                    sess.run([model.mean_loss[1], model.accuracy[1], model.auc[1]],
+                             feed_dict={model.inputs: inputs,
+                                        model.targets: targets,
+                                        model.target_ids: target_ids})
+                loss, accuracy, auc, summary_aucacc = sess.run(
+                    [model.mean_loss[0], model.accuracy[0], model.auc[0], merged_aucacc])
+
+                print("Epoch {},  Loss: {:.3f},  Accuracy: {:.3f},  AUC: {:.3f} (valid)"
+                      .format(epoch, loss, accuracy, auc), flush=True)
+                metrics_log.append(epoch, 'valid', loss, accuracy, auc,
+                                   wall_time=saved_time - start_time)
+                valid_writer.add_summary(summary_aucacc, epoch)
+                valid_writer.flush()
+
+                if results['best_valid_auc'] is None or auc > results['best_valid_auc']:
+                    results['best_valid_auc'] = float(auc)
+                    results['best_epoch'] = epoch
+                    results['best_checkpoint'] = best_saver.save(sess, best_path)
+                results['epochs_completed'] = epoch + 1
+                results['last_valid_auc'] = float(auc)
+                results['last_valid_loss'] = float(loss)
+                with open(results_path, 'w') as f:
+                    json.dump(results, f, indent=2, sort_keys=True)
+
+                kept.append(checkpoint)
+                if len(kept) > KEEP_CHECKPOINTS:
+                    remove_checkpoint(kept.pop(0))
+            if retry:
+                sleep(args.poll_interval)
+        valid_writer.close()
+
+
+if __name__ == '__main__':
+    main()